@@ -0,0 +1,112 @@
+#!/usr/bin/python
+
+"""
+Synthetic benchmarks for the parts of omnicalc which scale with the size of the dataset.
+Run these via "make benchmark <name>" from the omnicalc root directory.
+"""
+
+import os,re,time,collections
+import yaml
+from base.tools import status,regex_divider,treebucket
+
+default_paths = 'omni/base/default_paths.yaml'
+
+def synthetic_spot(nfiles,rootdir='/synthetic/spot/',nsteps=2):
+
+	"""
+	Generate file names which match the regexes in the default paths.yaml.
+	Each simulation has a few steps with one structure and an equal number of xtc, trr, edr, and tpr parts.
+	"""
+
+	parts_per_step = 100
+	ntops = max(1,int(nfiles/float(nsteps*(4*parts_per_step+1))))
+	fns = []
+	for top in range(ntops):
+		for step in range(nsteps):
+			stepdir = os.path.join(rootdir,'simulation-v%d'%(top+1),'s%02d-production'%(step+1))
+			fns.append(os.path.join(stepdir,'system.gro'))
+			for part in range(parts_per_step):
+				for suffix in ['xtc','trr','edr','tpr']:
+					fns.append(os.path.join(stepdir,'md.part%04d.%s'%(part+1,suffix)))
+	return fns[:nfiles]
+
+def treebucket_legacy(matches):
+
+	"""
+	The original treeparser organized the toc with nested comprehensions. Retained for comparison.
+	"""
+
+	toc = collections.OrderedDict()
+	for top in sorted(set(zip(*matches)[0])): toc[top] = collections.OrderedDict()
+	for top in toc:
+		for step in sorted(set([i[1] for i in matches if i[0]==top])):
+			parts = sorted([i[2] for i in matches if i[0]==top and i[1]==step])
+			toc[top][step] = collections.OrderedDict([(part,{}) for part in parts])
+	return toc
+
+def benchmark_treeparser(size=1000000,legacy=False):
+
+	"""
+	Time the regex matching and the toc construction in treeparser on a synthetic spot.
+	The legacy flag also times the original bucketing (which is quadratic, so use a smaller spot).
+	"""
+
+	with open(default_paths) as fp: regexes = yaml.load(fp.read())['spots']['sims']['regexes']
+	rootdir = '/synthetic/spot/'
+	fns = synthetic_spot(int(size),rootdir=rootdir)
+	status('generated %d synthetic file names'%len(fns),tag='benchmark')
+	timings = collections.OrderedDict()
+	for part_name,part_regex in regexes['part'].items():
+		regex = re.compile('^%s\/'%re.escape(rootdir.rstrip('/'))+
+			'\/'.join([regexes['top'],regexes['step'],part_regex])+'$')
+		divy = regex_divider(regexes['top'],regexes['step'],part_regex)
+		start = time.time()
+		matches = [divy(i.groups()) for fn in fns for i in [regex.search(fn)] if i]
+		timings[(part_name,'match')] = time.time()-start
+		start = time.time()
+		toc = treebucket(matches)
+		timings[(part_name,'bucket')] = time.time()-start
+		if legacy:
+			start = time.time()
+			if treebucket_legacy(matches)!=toc: raise Exception('[ERROR] legacy toc does not match')
+			timings[(part_name,'legacy')] = time.time()-start
+		status('%s: %d matches in %d simulations'%(part_name,len(matches),len(toc)),tag='benchmark')
+	for (part_name,stage),elapsed in timings.items():
+		status('%s %s %.3fs'%(part_name.ljust(10),stage.ljust(8),elapsed),tag='benchmark')
+	return timings
+
+def benchmark_lookups(size=10000,legacy=False):
+
+	"""
+	Time spotname_lookup and Workspace.slice for a synthetic workspace with many simulations.
+	The legacy flag also times the original scans over the toc and the slice keys.
+	"""
+
+	from base.workspace import Workspace
+	class SyntheticWorkspace(Workspace):
+		def __init__(self): pass
+	work = SyntheticWorkspace()
+	parts = ['xtc','trr','edr','tpr','structure']
+	sns = ['simulation-v%d'%(i+1) for i in range(int(size))]
+	work.toc = collections.OrderedDict([(('sims',part),collections.OrderedDict([(sn,{}) for sn in sns]))
+		for part in parts])
+	work.slices = dict([((spot,sn),{}) for spot in work.toc for sn in work.toc[spot]])
+	work.cursor,work.c,work.lookups = ('sims','xtc'),'sims',{}
+	timings = collections.OrderedDict()
+	start = time.time()
+	work.reindex('spotnames'),work.reindex('slices')
+	timings['reindex'] = time.time()-start
+	probes = sns[::max(1,len(sns)/1000)]
+	start = time.time()
+	for sn in probes: work.spotname_lookup(sn),work.slice(sn)
+	timings['indexed'] = time.time()-start
+	if legacy:
+		start = time.time()
+		for sn in probes: 
+			[key for key,val in work.toc.items() if sn in val]
+			[key for key in work.slices.keys() if key[1]==sn and key[0][1]=='xtc']
+		timings['legacy'] = time.time()-start
+	for stage,elapsed in timings.items():
+		status('%s %d simulations %d lookups %.4fs'%(stage.ljust(8),len(sns),
+			len(probes) if stage!='reindex' else 0,elapsed),tag='benchmark')
+	return timings
@@ -25,6 +25,26 @@ computer_error_attrs_passthrough = """
 [ERROR] will tell you which attributes are causing the problem
 """
 
+def computer_fn_base(work,sn,slice_name,group,name,records=None):
+
+	"""
+	Name the data for a calculation on one simulation according to its slice, group, and calculation name.
+	The planner sends the slice records for slices which have not been made yet.
+	"""
+
+	records = work.slice(sn) if records==None else records
+	#---if we combine slices for this calculation we use the whole time span in the base filename
+	if type(slice_name)==list:
+		#---! simple method for making the combination file key
+		start = min([records[s]['all' if not group else group]['start'] for s in slice_name])
+		end = max([records[s]['all' if not group else group]['end'] for s in slice_name])
+		skip = records[slice_name[-1]]['all' if not group else group]['skip']
+		#---! this filekey construction means the user will have to anticipate the names of combos
+		return '%s.%d-%d-%d.%s'%(work.prefixer(sn),start,end,skip,name)
+	elif not group:
+		return re.findall('^v[0-9]+\.[0-9]+-[0-9]+-[0-9]+',records[slice_name]['all']['filekey'])[0]+'.%s'%name
+	else: return records[slice_name][group]['filekey']+'.%s'%name
+
 def computer(function,**kwargs):
 
 	"""
@@ -126,37 +146,29 @@ def computer(function,**kwargs):
 	for outgoing in jobs:
 		sn,slice_name,group = outgoing['sn'],outgoing['slice_name'],outgoing['group']
 		
-		#---if we combine slices for this calculation we use the whole time span in the base filename
-		if type(slice_name)==list:
-			#---! simple method for making the combination file key
-			start = min([work.slice(sn)[s]['all' if not group else group]['start'] for s in slice_name])
-			end = max([work.slice(sn)[s]['all' if not group else group]['end'] for s in slice_name])
-			skip = work.slice(sn)[s]['all' if not group else group]['skip']
-			#---! this filekey construction means the user will have to anticipate the names of combos
-			fn_base = '%s.%d-%d-%d.%s'%(work.prefixer(sn),start,end,skip,function.__name__)
+		#---we index all calculations automatically in case we loop over specs later
+		index,fn_key = -1,''
+		try: fn_base = computer_fn_base(work,sn,slice_name,group,function.__name__)
+		except:
+			print "no group and cannot get base filename"
+			import pdb;pdb.set_trace()
+		#---hashed names identify the result directly but we also check for indexed results from before
+		if work.post_naming=='hashed':
+			fn_key = work.post_key(fn_base,calc['specs'])
+			fn = fn_base+fn_key+'.dat'
+			exists = os.path.isfile(work.postdir+fn) or work.select_postdata(fn_base,calc)!=None
 		else:
-			#---we index all calculations automatically in case we loop over specs later
-			index,fn_key = -1,''
-			if not group:
-				fn_base = re.findall('^v[0-9]+\.[0-9]+-[0-9]+-[0-9]+',
-					work.slice(sn)[slice_name][
-					'all' if not group else group]['filekey'])[0]+'.%s'%function.__name__
-			else:
-				try: fn_base = work.slice(sn)[slice_name][
-					'all' if not group else group]['filekey']+'.%s'%function.__name__
-				except:
-					print "no group and cannot get base filename"
-					import pdb;pdb.set_trace()
-		prev = glob.glob(work.postdir+fn_base+'*.dat')
-		if prev == []: index = 0
-		else: index = max(map(lambda x:int(re.findall('^.+\/%s\.n([0-9]+)\.dat'%fn_base,x)[0]),prev))+1
-		fn_key = '.n%d'%index
-		fn = fn_base+fn_key+'.dat'
-		#---safety check for file errors to prevent overwriting however this should be handled by indices
-		if os.path.isfile(work.postdir+fn): raise Exception('[ERROR] %s exists'%(work.postdir+fn))
-		
-		#---check for specs file with the exact same specifications
-		exists = True if index != -1 and work.select_postdata(fn_base,calc) != None else False
+			prev = glob.glob(work.postdir+fn_base+'*.dat')
+			if prev == []: index = 0
+			else: 
+				index = max(map(lambda x:int(re.findall('^.+\/%s\.n([0-9]+)\.dat'%fn_base,x)[0]),
+					[i for i in prev if re.match('^.+\/%s\.n([0-9]+)\.dat'%fn_base,i)])+[-1])+1
+			fn_key = '.n%d'%index
+			fn = fn_base+fn_key+'.dat'
+			#---safety check for file errors to prevent overwriting however this should be handled by indices
+			if os.path.isfile(work.postdir+fn): raise Exception('[ERROR] %s exists'%(work.postdir+fn))
+			#---check for specs file with the exact same specifications
+			exists = True if index != -1 and work.select_postdata(fn_base,calc) != None else False
 		if not exists:
 			import ipdb;ipdb.set_trace()
 			status("%s %s"%(function.__name__,str(outgoing)),tag='compute')
@@ -192,8 +204,11 @@ def computer(function,**kwargs):
 				status('some calculation specs were not saved: %s'%
 					str(unaccounted),tag='STATUS')
 				import pdb;pdb.set_trace()
+			#---the postdata index only advances if nothing else changed the post directory
+			post_mtime = os.stat(work.postdir).st_mtime
 			store(result,fn,work.postdir,attrs=attrs)
 			with open(work.postdir+fn_base+fn_key+'.spec','w') as fp: fp.write(json.dumps(attrs)+'\n')
+			work.postdata_register(fn_base+fn_key+'.spec',attrs,mtime=post_mtime)
 	#---no modifications to work so no save
 	return
 
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+
+"""
+Store the workspace in an SQLite database instead of a single pickle.
+Each leaf of the toc, each slice record, and each group record is a separate row so that saving the
+workspace only writes the records which changed.
+"""
+
+import os,sqlite3,pickle,ast,hashlib,collections
+
+#---sections of the workspace and the depth at which we divide them into records
+#---a depth of zero stores the entire section in one record
+workspace_sections = collections.OrderedDict([
+	('toc',4),('slices',3),('groups',2),('post',1),('manifest',2),('frames',1),
+	('vars',0),('meta',0),('calc',0)])
+
+#---records are either values or empty dictionaries above the record depth
+kind_value,kind_branch = 0,1
+
+def flatten_records(tree,depth,path=()):
+
+	"""
+	Divide a nested dictionary into (path,kind,value) records at a particular depth.
+	Empty dictionaries above that depth are recorded so they are restored on load.
+	"""
+
+	if len(path)==depth or not isinstance(tree,dict): yield path,kind_value,tree
+	elif not tree: yield path,kind_branch,None
+	else:
+		for key,val in tree.items():
+			for record in flatten_records(val,depth,path+(key,)): yield record
+
+def unflatten_records(records):
+
+	"""
+	Rebuild a nested dictionary from ordered (path,kind,value) records.
+	"""
+
+	root = collections.OrderedDict()
+	for path,kind,value in records:
+		if path==(): return value if kind==kind_value else root
+		point = root
+		for key in path[:-1]: point = point.setdefault(key,collections.OrderedDict())
+		if kind==kind_value: point[path[-1]] = value
+		else: point.setdefault(path[-1],collections.OrderedDict())
+	return root
+
+class WorkspaceDatabase:
+
+	"""
+	An SQLite table of workspace records which remembers the digest of every record it has read or written.
+	"""
+
+	def __init__(self,fn):
+
+		self.filename = fn
+		self.conn = sqlite3.connect(fn)
+		self.conn.text_factory = str
+		self.conn.execute('create table if not exists records (section text, key text, seq integer, '+
+			'kind integer, value blob, primary key (section,key))')
+		self.conn.commit()
+		#---digests of the stored records indexed by section and key
+		self.digests = {}
+
+	def empty(self):
+
+		"""
+		Check whether the database has any records.
+		"""
+
+		return self.conn.execute('select count(*) from records').fetchone()[0]==0
+
+	def load_section(self,section):
+
+		"""
+		Read one section of the workspace.
+		"""
+
+		rows = self.conn.execute('select key,seq,kind,value from records where section=? order by seq',
+			(section,)).fetchall()
+		if not rows: return None
+		digests = self.digests[section] = {}
+		records = []
+		for key,seq,kind,value in rows:
+			blob = str(value)
+			digests[key] = (seq,kind,hashlib.md5(blob).hexdigest())
+			records.append((ast.literal_eval(key),kind,pickle.loads(blob)))
+		return unflatten_records(records)
+
+	def digest_section(self,section):
+
+		"""
+		Read the digests for a section which we have not loaded so that we can compare records on save.
+		"""
+
+		self.digests[section] = dict([(key,(seq,kind,hashlib.md5(str(value)).hexdigest())) 
+			for key,seq,kind,value in self.conn.execute(
+			'select key,seq,kind,value from records where section=?',(section,))])
+
+	def load(self):
+
+		"""
+		Read every section of the workspace.
+		"""
+
+		return dict([(section,self.load_section(section)) for section in workspace_sections])
+
+	def save(self,state):
+
+		"""
+		Write the records in each section of state which differ from the stored records.
+		Returns the number of records which were written or deleted.
+		"""
+
+		changes = 0
+		with self.conn:
+			for section,tree in state.items():
+				if section not in self.digests: self.digest_section(section)
+				previous = self.digests[section]
+				current = {}
+				for seq,(path,kind,value) in enumerate(
+					flatten_records(tree,workspace_sections[section])):
+					key = repr(path)
+					blob = pickle.dumps(value,2)
+					current[key] = (seq,kind,hashlib.md5(blob).hexdigest())
+					if previous.get(key,None)==current[key]: continue
+					elif key in previous and previous[key][1:]==current[key][1:]:
+						self.conn.execute('update records set seq=? where section=? and key=?',
+							(seq,section,key))
+					else:
+						self.conn.execute('insert or replace into records values (?,?,?,?,?)',
+							(section,key,seq,kind,sqlite3.Binary(blob)))
+					changes += 1
+				for key in [i for i in previous if i not in current]:
+					self.conn.execute('delete from records where section=? and key=?',(section,key))
+					changes += 1
+				self.digests[section] = current
+		return changes
+
+class DeferredSection:
+
+	"""
+	A section of the workspace database which is only read when the workspace first needs it.
+	"""
+
+	def __init__(self,database,section):
+
+		self.database = database
+		self.section = section
+
+	def unpack(self): 
+
+		section = self.database.load_section(self.section)
+		return section if section!=None else {}
@@ -2,8 +2,11 @@
 
 import time
 from gromacs import *
-import os,subprocess,re
+import os,subprocess,re,struct,bisect,shutil,json,threading
+from multiprocessing.pool import ThreadPool
+import numpy as np
 from tools import call,status,delve
+from xdr import edr_times
 import MDAnalysis
 
 def gmxread(grofile,trajfile=None):
@@ -25,13 +28,19 @@ def mdasel(uni,select):
 	if hasattr(uni,'select_atoms'): return uni.select_atoms(select)
 	else: return uni.selectAtoms(select)
 
-def edrcheck(fn,debug=False):
+def edrcheck(fn,debug=False,native=True):
 
 	"""
 	Given the path of an EDR file we return its start and end time.
+	We read the first and last frame headers directly unless the file cannot be parsed, in which case we 
+	fall back to gmx check, which decodes every frame.
 	!!! Perhaps store the EDR data in a more comprehensive format.
 	"""
 
+	if native:
+		try: times = edr_times(fn)
+		except (IOError,OSError,struct.error): times = None
+		if times: return times
 	start,end = None,None
 	cmd = gmxpaths['gmxcheck']+' -e %s'%fn
 	p = subprocess.Popen(cmd,stdout=subprocess.PIPE,stdin=subprocess.PIPE,stderr=subprocess.PIPE,shell=True)
@@ -72,64 +81,243 @@ def infer_parts_to_slice(start,end,skip,sequence):
 			sources.append((key,t0))
 	return sources
 
+def select_frames_to_slice(start,end,skip,frametimes,tolerance=0.001):
+
+	"""
+	Choose the trajectory parts for a slice from the actual frame times in each part.
+	The frametimes are a list of keys and arrays of times for each part, in trajectory order. We keep the 
+	parts in a sorted interval structure so we only inspect parts which overlap the slice. When a requested 
+	time appears in several parts (e.g. after a restart) we take it from the later part, as trjcat does.
+	Returns the keys, the first and last requested times, and the frame indices for each part we need.
+	"""
+
+	targets = np.arange(start,end+skip,skip).astype(float)
+	#---sorted interval structure holding the first time, last time, and order of each part
+	intervals = sorted([(times.min(),times.max(),ii) for ii,(keys,times) in enumerate(frametimes) 
+		if len(times)>0])
+	firsts = [i[0] for i in intervals]
+	overlapping = sorted([ii for first,last,ii in intervals[:bisect.bisect_right(firsts,end+tolerance)]
+		if last>=start-tolerance])
+	claimed = np.zeros(len(targets),dtype=bool)
+	sources = []
+	for ii in overlapping[::-1]:
+		keys,times = frametimes[ii]
+		#---match each frame to the nearest requested time
+		right = np.clip(np.searchsorted(targets,times),0,len(targets)-1)
+		left = np.clip(right-1,0,len(targets)-1)
+		nearest = np.where(np.abs(targets[left]-times)<np.abs(targets[right]-times),left,right)
+		matched = np.abs(targets[nearest]-times)<tolerance
+		frames,found = [],set()
+		for fr in np.where(matched)[0]:
+			if not claimed[nearest[fr]] and nearest[fr] not in found:
+				frames.append(fr)
+				found.add(nearest[fr])
+		if not frames: continue
+		claimed[list(found)] = True
+		picked = targets[sorted(found)]
+		sources.append((keys,picked[0],picked[-1],np.array(frames)))
+	return sources[::-1]
+
 def slice_trajectory(start,end,skip,sequence,outkey,postdir,tpr_keyfinder,traj_keyfinder,
-	output_format='xtc',pbc=None,group_fn=None):
+	output_format='xtc',pbc=None,group_fn=None,frametimes=None,nthreads=1,scratch=None):
 
 	"""
 	Make a trajectory slice.
 	The keyfinders are lambda functions that take keys and return the correct filename.
+	If the frametimes for each trajectory part are available we convert exactly the frames we need from 
+	each part, otherwise we infer the parts from the EDR times in the sequence.
+	The parts are converted by up to nthreads trjconv processes at once.
+	If we have a scratch directory we write the intermediate files there and move only the slice to postdir.
+	Completed parts are recorded in a manifest in the working directory so that an interrupted or failed 
+	slice only converts the remaining parts when we try again.
 	"""
 
+	#---work in a subdirectory of scratch for each slice or in the post directory
+	if scratch: 
+		cwd = os.path.join(scratch,outkey,'')
+		if not os.path.isdir(cwd): os.makedirs(cwd)
+	else: cwd = os.path.join(postdir,'')
 	#---commands to create sub-slices
-	sources = infer_parts_to_slice(start,end,skip,sequence)
+	if frametimes!=None: sources = select_frames_to_slice(start,end,skip,frametimes)
+	else: sources = [(keys,t0,end,None) for keys,t0 in infer_parts_to_slice(start,end,skip,sequence)]
+	if not sources: raise Exception('[ERROR] cannot find any frames for slice %s'%outkey)
 	sn = sources[0][0][0]
-	group_flag = '' if not group_fn else ' -n '+group_fn
+	group_flag = '' if not group_fn else ' -n '+os.path.join(postdir,group_fn)
 	pbc_flag = '' if not pbc else ' -pbc %s'%pbc
-	cmdlist = []
+	cmdlist,identities = [],{}
 	for num,source in enumerate(sources):
-		keys,t0 = source
+		keys,t0,t1,frames = source
 		sn = keys[0]
 		#---get tpr exist use the previous one (or fail on first source)
-		try: tpr = tpr_keyfinder(*keys,strict=False)
+		#---source paths are absolute because we run trjconv in the scratch or post directory
+		try: tpr = os.path.abspath(tpr_keyfinder(*keys,strict=False))
 		except: pass
 		#---assume cursor points to the trajectory we want
-		try: traj = traj_keyfinder(*keys)
+		try: traj = os.path.abspath(traj_keyfinder(*keys))
 		except:
 			status('could not locate trajectory for %s,%s,%s'%keys)
 			continue
-		outfile = 'trjconv%d.%s'%(num,output_format)
+		#---intermediate files are named by the outkey so that we can make several slices at once
+		outfile = '%s.trjconv%d.%s'%(outkey,num,output_format)
 		tail = ' -b %d -e %d -dt %d -s %s -f %s -o %s%s%s'%(
-			t0 if t0>start else start,end,skip,tpr,traj,
+			t0 if t0>start else start,t1,skip,tpr,traj,
 			outfile,group_flag,pbc_flag)
 		cmdlist.append((outfile,gmxpaths['trjconv']+tail))
+		stat = os.stat(traj)
+		identities[outfile] = [stat.st_size,stat.st_mtime]
 
 	#---make a GRO file of the first frame for reference
-	keys,t0 = sources[0]
+	keys,t0,t1,frames = sources[0]
 	sn,sub,fn = keys
-	traj = traj_keyfinder(*keys)
-	tail = ' -dump %d -s %s -f %s -o %s.gro%s'%(start,tpr,traj,outkey,group_flag)
+	traj = os.path.abspath(traj_keyfinder(*keys))
+	tail = ' -dump %d -s %s -f %s -o %s.gro%s'%(t0 if t0>start else start,tpr,traj,outkey,group_flag)
 	if pbc != None: tail = tail + ' -pbc %s'%pbc
 	call(gmxpaths['trjconv']+tail,
-		cwd=postdir,inpipe='0\n',logfile='log-trjconv-frame')
+		cwd=cwd,inpipe='0\n',logfile='log-trjconv-frame-%s'%outkey)
 	
-	#---convert relevant trajectories
+	#---the manifest holds the command, source identity, and output size for each completed part
+	manifest_fn = cwd+'%s.parts.json'%outkey
+	manifest,lock = {},threading.Lock()
+	if os.path.isfile(manifest_fn):
+		with open(manifest_fn) as fp: manifest = json.loads(fp.read())
+	def completed(outfile,cmd):
+		record = manifest.get(outfile,None)
+		return (record!=None and record['cmd']==cmd and record['source']==identities[outfile] 
+			and os.path.isfile(cwd+outfile) and os.path.getsize(cwd+outfile)==record['size'])
+	pending = [(outfile,cmd) for outfile,cmd in cmdlist if not completed(outfile,cmd)]
+	if len(pending)<len(cmdlist): 
+		status('resuming slice %s with %d/%d parts already converted'%(
+			outkey,len(cmdlist)-len(pending),len(cmdlist)),tag='status')
+
+	#---convert relevant trajectories with a separate trjconv process and log for each part
 	start = time.time()
-	for ii,(outfile,cmd) in enumerate(cmdlist):
-		status('slicing trajectory',i=ii,looplen=len(cmdlist),start=start,tag='SLICE',show_bar=False)
-		call(cmd,logfile='log-trjconv-%s'%outfile,cwd=postdir,inpipe='0\n',silent=False)
+	def convert(outcmd):
+		outfile,cmd = outcmd
+		#---remove partial output from an interrupted conversion so trjconv does not make a backup
+		if os.path.isfile(cwd+outfile): os.remove(cwd+outfile)
+		call(cmd,logfile='log-trjconv-%s'%outfile,cwd=cwd,inpipe='0\n',silent=False)
+		with open(cwd+'log-trjconv-%s'%outfile,'r') as fp: lines = fp.readlines()
+		if any(filter(lambda x:re.search('(F|f)atal error',x),lines)): return outfile,False
+		if not os.path.isfile(cwd+outfile): return outfile,False
+		with lock:
+			manifest[outfile] = {'cmd':cmd,'source':identities[outfile],'size':os.path.getsize(cwd+outfile)}
+			with open(manifest_fn+'.tmp','w') as fp: fp.write(json.dumps(manifest))
+			os.rename(manifest_fn+'.tmp',manifest_fn)
+		return outfile,True
+	pool = ThreadPool(max(1,min(nthreads,len(pending))))
+	valid = dict([(outfile,True) for outfile,cmd in cmdlist])
+	try:
+		for ii,(outfile,success) in enumerate(pool.imap_unordered(convert,pending)):
+			status('slicing trajectory',i=ii,looplen=len(pending),start=start,tag='SLICE',show_bar=False)
+			valid[outfile] = success
+	finally:
+		pool.close()
+		pool.join()
 	
-	#---concatenate remaining steps with no errors
-	valid_parts = range(len(cmdlist))
-	for key in range(len(cmdlist)):
-		with open(postdir+'/log-trjconv-%s'%outfile,'r') as fp: lines = fp.readlines()
-		if any(filter(lambda x:re.search('(F|f)atal error',x),lines)): valid_parts.remove(key)
+	#---concatenate the parts only if they all succeeded otherwise we keep them for the next attempt
+	failed_logs = ['log-trjconv-%s'%outfile for outfile,cmd in cmdlist if not valid[outfile]]
+	#---keep the logs for parts that failed in the post directory
+	if scratch:
+		for log in failed_logs: shutil.copy(cwd+log,os.path.join(postdir,log))
+	if failed_logs: 
+		raise Exception('[ERROR] trjconv failed on %d/%d parts of %s (see %s in %s). '%(
+			len(failed_logs),len(cmdlist),outkey,', '.join(failed_logs),postdir)+
+			'the other parts are kept so that the next attempt only converts these')
 	call(gmxpaths['trjcat']+' -o %s.%s -f '%(outkey,output_format)+
-		' '.join(zip(*cmdlist)[0]),cwd=postdir,logfile='log-trjcat-%s'%outkey)
-		
-	#---delete extraneous files
-	#---! consider using a temporary directory although it's nice to have things onsite
-	for outfile in zip(*cmdlist)[0]:
-		os.remove(postdir+'/%s'%outfile)
-		os.remove(postdir+'/log-trjconv-%s'%outfile)
-	os.remove(postdir+'/log-trjcat-%s'%outkey)
-	os.remove(postdir+'log-trjconv-frame')
+		' '.join([outfile for outfile,cmd in cmdlist]),cwd=cwd,logfile='log-trjcat-%s'%outkey)
+
+	#---move the slice from scratch and delete extraneous files 
+	if scratch:
+		for fn in ['%s.gro'%outkey,'%s.%s'%(outkey,output_format)]: 
+			shutil.move(cwd+fn,os.path.join(postdir,fn))
+		shutil.rmtree(cwd)
+		#---remove the logs we kept from a previous attempt
+		for outfile,cmd in cmdlist:
+			log = os.path.join(postdir,'log-trjconv-%s'%outfile)
+			if os.path.isfile(log): os.remove(log)
+	else:
+		for outfile,cmd in cmdlist:
+			for fn in [outfile,'log-trjconv-%s'%outfile]:
+				if os.path.isfile(cwd+fn): os.remove(cwd+fn)
+		os.remove(cwd+'log-trjcat-%s'%outkey)
+		os.remove(cwd+'log-trjconv-frame-%s'%outkey)
+		os.remove(manifest_fn)
+
+def ndx_indices(fn):
+
+	"""
+	Read the (zero-based) atom indices from an NDX file with a single group.
+	"""
+
+	with open(fn) as fp: text = fp.read()
+	return np.array(re.sub('\[.*?\]','',text).split(),dtype=int)-1
+
+def mdawriter(fn,natoms):
+
+	"""
+	Open a trajectory writer in MDAnalysis regardless of version.
+	"""
+
+	try: return MDAnalysis.Writer(fn,n_atoms=natoms)
+	except TypeError: return MDAnalysis.Writer(fn,numatoms=natoms)
+
+def slice_trajectory_numpy(start,end,skip,frametimes,targets,postdir,structure,traj_keyfinder,
+	output_format='xtc'):
+
+	"""
+	Make slices by reading the frames we need with MDAnalysis and selecting atoms with numpy.
+	This engine avoids a trjconv process for each part but cannot apply periodic boundary corrections.
+	Each target is an outkey and an NDX file (or None for all atoms) so one read of the trajectory makes 
+	slices for several groups.
+	"""
+
+	sources = select_frames_to_slice(start,end,skip,frametimes)
+	if not sources: raise Exception('[ERROR] cannot find any frames for slices %s'%
+		', '.join(zip(*targets)[0]))
+	#---write incomplete slices to temporary names and rename them when they are done
+	indices = [ndx_indices(os.path.join(postdir,group_fn)) if group_fn else None for outkey,group_fn in targets]
+	writers = []
+	start_time = time.time()
+	try:
+		for num,(keys,t0,t1,frames) in enumerate(sources):
+			status('slicing trajectory',i=num,looplen=len(sources),start=start_time,tag='SLICE',show_bar=False)
+			traj = traj_keyfinder(*keys)
+			uni = MDAnalysis.Universe(structure,traj)
+			selections = [uni.atoms[i] if i is not None else uni.atoms for i in indices]
+			if not writers: 
+				writers = [mdawriter(os.path.join(postdir,'%s.incomplete.%s'%(outkey,output_format)),
+					len(sel)) for (outkey,group_fn),sel in zip(targets,selections)]
+				#---the structure for each slice is the first frame
+				uni.trajectory[frames[0]]
+				for (outkey,group_fn),sel in zip(targets,selections): 
+					sel.write(os.path.join(postdir,'%s.incomplete.gro'%outkey))
+			for fr in frames:
+				uni.trajectory[fr]
+				for writer,sel in zip(writers,selections): writer.write(sel)
+	finally:
+		for writer in writers: writer.close()
+	for outkey,group_fn in targets:
+		for suffix in ['gro',output_format]:
+			os.rename(os.path.join(postdir,'%s.incomplete.%s'%(outkey,suffix)),
+				os.path.join(postdir,'%s.%s'%(outkey,suffix)))
+
+def subsample_slice(start,end,skip,superset,outkey,postdir,group_fn=None,output_format='xtc'):
+
+	"""
+	Make a slice from a larger slice in the post directory with trjconv instead of the original parts.
+	The superset is the filekey of a slice whose window contains the new one and whose skip divides the 
+	new skip. The group_fn selects a group from a superset which contains all atoms.
+	"""
+
+	group_flag = '' if not group_fn else ' -n '+os.path.join(postdir,group_fn)
+	source = ' -s %s.gro -f %s.%s'%(superset,superset,output_format)
+	call(gmxpaths['trjconv']+' -dump %d%s -o %s.gro%s'%(start,source,outkey,group_flag),
+		cwd=postdir,inpipe='0\n',logfile='log-trjconv-frame-%s'%outkey)
+	call(gmxpaths['trjconv']+' -b %d -e %d -dt %d%s -o %s.%s%s'%(
+		start,end,skip,source,outkey,output_format,group_flag),
+		cwd=postdir,inpipe='0\n',logfile='log-trjconv-%s'%outkey)
+	for log in ['log-trjconv-frame-%s'%outkey,'log-trjconv-%s'%outkey]:
+		with open(postdir+'/'+log) as fp: 
+			if re.search('(F|f)atal error',fp.read()): 
+				raise Exception('[ERROR] failed to subsample %s from %s. see %s'%(outkey,superset,postdir+log))
+		os.remove(postdir+'/'+log)
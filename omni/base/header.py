@@ -36,7 +36,7 @@ conf_paths,conf_gromacs = "paths.yaml","gromacs.py"
 #---get the active workspace
 if 'work' not in globals() and not building_docs :
 	workspace = unpacker(conf_paths)['workspace_spot']
-	work = Workspace(workspace,previous=False)
+	work = Workspace(workspace,previous=False,lazy=True)
 
 #---INTERFACE
 
@@ -1,6 +1,6 @@
 #!/usr/bin/python
 
-import os,sys,re,inspect,subprocess,time,collections
+import os,sys,re,inspect,subprocess,time,collections,json,hashlib
 import traceback
 import yaml
 
@@ -31,6 +31,73 @@ if 0:
 	yaml.add_representer(collections.OrderedDict,dict_representer)
 	yaml.add_constructor(_mapping_tag,dict_constructor)
 
+def regex_divider(*regexes):
+
+	"""
+	Prepare a lambda that divides the groups from a combined regex into one item per regex and reduces 
+	them to strings if the corresponding regex has only one group.
+	"""
+
+	group_counts = [sum([i[0]=='subpattern' for i in re.sre_parse.parse(regex)]) for regex in regexes]
+	cursor = ([0]+[sum(group_counts[:i+1]) for i in range(len(group_counts))])
+	slices = [slice(cursor[i],cursor[i+1]) for i in range(len(cursor)-1)]
+	divy = lambda x: [y[0] if len(y)==1 else y for y in [x[s] for s in slices]]
+	return divy
+
+def regex_template(regex):
+
+	"""
+	Convert a regex into a string template which rebuilds a matching string from the regex groups.
+	"""
+
+	return ''.join(['%s' if i[0]=='subpattern' else chr(i[1]) for i in re.sre_parse.parse(regex)])
+
+def treebucket(matches):
+
+	"""
+	Organize a list of (top,step,part) keys into a doubly-nested, sorted dictionary of parts.
+	We group the keys in a single pass and sort each level once so the cost is linear in the matches.
+	"""
+
+	buckets = {}
+	for top,step,part in matches: buckets.setdefault(top,{}).setdefault(step,[]).append(part)
+	return collections.OrderedDict([(top,collections.OrderedDict([
+		(step,collections.OrderedDict([(part,{}) for part in sorted(buckets[top][step])]))
+		for step in sorted(buckets[top])])) for top in sorted(buckets)])
+
+def spechash(obj):
+
+	"""
+	Hash a specification (e.g. the specs for a calculation) in a canonical form with sorted keys.
+	"""
+
+	return hashlib.md5(json.dumps(obj,sort_keys=True,default=str)).hexdigest()
+
+#---scripts found by script_registry indexed by the root and pruned directories
+script_registry_cache = {}
+
+def script_registry(root='./',prune=()):
+
+	"""
+	List the python scripts below a directory for finding calculation and plot scripts.
+	The list is built once per process and rebuilt only when the modification time of a directory changes.
+	We do not descend into pruned directories e.g. the post and plot directories.
+	"""
+
+	prune = tuple(sorted(set([os.path.realpath(i) for i in prune])))
+	cached = script_registry_cache.get((root,prune),None)
+	if cached:
+		try: 
+			if all([os.stat(d).st_mtime==m for d,m in cached['mtimes'].items()]): return cached['scripts']
+		except OSError: pass
+	mtimes,scripts = {},[]
+	for dirpath,dirnames,filenames in os.walk(root):
+		mtimes[dirpath] = os.stat(dirpath).st_mtime
+		dirnames[:] = [i for i in dirnames if os.path.realpath(os.path.join(dirpath,i)) not in prune]
+		scripts.extend([dirpath+'/'+fn for fn in filenames if fn.endswith('.py')])
+	script_registry_cache[(root,prune)] = {'mtimes':mtimes,'scripts':scripts}
+	return scripts
+
 def unpacker(fn,name=None):
 
 	"""
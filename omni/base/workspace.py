@@ -1,14 +1,20 @@
 #!/usr/bin/python
 
-import sys,os,re,time,glob
+import sys,os,re,time,glob,errno
 import yaml
 import pickle,json,copy,glob,signal,collections
+import multiprocessing,itertools
+from multiprocessing.pool import ThreadPool
 from base.tools import unpacker,path_expand,status,argsort,unescape,tupleflat
 from base.tools import delve,asciitree,catalog,status,unique,flatten,tracer,call
+from base.tools import regex_divider,regex_template,treebucket,spechash,script_registry
 from base.gromacs_interface import gmxread,mdasel,edrcheck,slice_trajectory,machine_name
+from base.gromacs_interface import slice_trajectory_numpy,subsample_slice
+from base.xdr import xtc_index
+from base.database import WorkspaceDatabase,DeferredSection,workspace_sections
 from base.gromacs import gmxpaths
 from base.hypothesis import hypothesis
-from base.computer import computer
+from base.computer import computer,computer_fn_base
 from base.timer import checktime
 from base.store import picturefind,store,load
 from copy import deepcopy
@@ -20,9 +26,39 @@ conf_paths,conf_gromacs = "paths.yaml","gromacs.py"
 #---joblib and multiprocessing modules require all functions to be registered in __main__
 # WHAT WAS I THINKING? for fn in glob.glob('calcs/codes/*.py'): execfile(fn)
 
+#---the workspace is inherited by the forked processes which make slices (see Workspace.action)
+slice_workspace = None
+
+def slice_worker(args):
+
+	"""
+	Make the groups and slices for one simulation in a forked copy of the workspace and return the changes.
+	"""
+
+	sn,root,retry = args
+	work = slice_workspace
+	frames = set(work.frames.keys())
+	toc_keys = work.slice_toc_keys(sn)
+	errors = work.slice_simulation(sn,root,retry=retry)
+	return {'errors':errors,'groups':work.groups[sn],
+		'slices':dict([(key,val) for key,val in work.slices.items() if key[1]==sn]),
+		'frames':dict([(key,val) for key,val in work.frames.items() if key not in frames]),
+		'toc':dict([(spot,work.toc[spot][sn]) for spot,keys in work.slice_toc_keys(sn).items() 
+			if keys!=toc_keys.get(spot,None)])}
+
 #---CLASS
 #-------------------------------------------------------------------------------------------------------------
 
+class PackedSection:
+
+	"""
+	A section of the workspace which is pickled separately inside the workspace pickle so that it can be 
+	unpacked when the workspace first needs it.
+	"""
+
+	def __init__(self,blob): self.blob = blob
+	def unpack(self): return pickle.loads(self.blob)
+
 class Workspace():
 
 	"""
@@ -49,14 +85,30 @@ class Workspace():
 	conf_gromacs = conf_gromacs
 	#---throw an error if you are missing more than 20% of the data
 	missing_frame_tolerance = 0.2
+	#---number of threads for listing directories when parsing a spot (machine configuration can override)
+	scan_threads = 8
+	#---concurrent trjconv processes for the parts of each slice (machine configuration key trjconv_threads)
+	#---...which multiplies with the slice_procs simulations we slice at once so we default to serial parts
+	trjconv_threads = 1
+	#---sidecar file in the post directory which holds EDR times keyed by file identity (renamed when the
+	#---...native reader changed so that we discard times which it reported incorrectly)
+	edr_cache_fn = 'edr_times.v2.json'
+	#---journal in the post directory which indexes the spec files for calculations (see postdata_index)
+	postdata_index_fn = 'postdata_index.jsonl'
+	#---subdirectory of the post directory which holds atom selections (see selection)
+	selection_cache_dir = 'selections'
 	#---! deprecated below?
 	members_with_specific_parts = ['slices']
+	#---sections of the workspace which may be loaded on first access
+	lazy_sections = ['toc','slices','groups','post','meta','manifest','frames']
 
-	def __init__(self,fn,previous=False,autoreload=False):
+	def __init__(self,fn,previous=False,autoreload=False,lazy=False):
 
 		"""
 		Note that we initialize paths.yaml and superficial data first, then load from the workspace or
 		parse the dataset if the workspace was not saved.
+		The lazy flag defers loading the larger sections of a saved workspace until they are accessed, 
+		which is useful for plotting and interactive sessions which only need a few of them.
 		"""
 		self.filename = path_expand(fn)
 		self.paths = unpacker(conf_paths)
@@ -68,10 +120,21 @@ class Workspace():
 		self.write_timeseries_to_disk = self.paths.get('timekeeper',False)
 		self.postdir = os.path.join(path_expand(self.paths['post_data_spot']),'')
 		self.plotdir = os.path.join(path_expand(self.paths['post_plot_spot']),'')
+		#---slices are assembled in an optional scratch directory (e.g. on local disk) and moved to postdir
+		scratch = self.paths.get('scratch_spot',None)
+		self.scratchdir = os.path.join(path_expand(scratch),'') if scratch else None
+		#---slices without pbc can be made with trjconv or by reading frames in-process with numpy
+		self.slice_engine = self.paths.get('slice_engine','trjconv')
+		if self.slice_engine not in ['trjconv','numpy']:
+			raise Exception('\n[ERROR] slice_engine must be "trjconv" or "numpy" in %s'%conf_paths)
 		#---generic variables associated with the workspace
 		self.vars = {}
 		self.meta = {}
 		self.calc = {}
+		#---directory modification times and contents from previous parsings of each spot
+		self.manifest = {}
+		#---frame offsets and times for trajectory files keyed by path (see frame_index)
+		self.frames = {}
 		#---automatically add preexisting files to the workspace if they are found
 		self.autoreload = autoreload
 
@@ -94,6 +157,9 @@ class Workspace():
 					'namer_text':details['namer'],
 					}
 				self.spots[spot]['divy_keys'] = self.divy_keys(spot)
+				#---templates rebuild file names from toc keys (see keys_to_filenames)
+				self.spots[spot]['templates'] = [regex_template(self.spots[spot][key]) 
+					for key in ['top','step','part']]
 		#---we always require an xtc entry in the parts list
 		if 'xtc' not in zip(*self.spots.keys())[1]: 
 			raise Exception('\n[ERROR] you must have "xtc" in the parts list')
@@ -104,11 +170,26 @@ class Workspace():
 		#---! default to XTC
 		self.trajectory_format = 'xtc'
 		self.merge_method = self.paths.get('merge_method','careful')
+		#---the workspace is saved to a pickle by default or to an SQLite database with one row per record
+		self.store_format = self.paths.get('workspace_store','pickle')
+		if self.store_format not in ['pickle','sqlite']:
+			raise Exception('\n[ERROR] workspace_store must be "pickle" or "sqlite" in %s'%conf_paths)
+		#---computed data are named by an index (.nN) or a hash (.h<md5>) of the slice, calculation, and specs
+		self.post_naming = self.paths.get('post_naming','indexed')
+		if self.post_naming not in ['indexed','hashed']:
+			raise Exception('\n[ERROR] post_naming must be "indexed" or "hashed" in %s'%conf_paths)
+		self.database_filename = self.filename+'.sqlite'
+		self.database = None
+		#---sections which have not been unpacked yet (see __getattr__)
+		self.deferred = {}
+		#---reverse indexes for simulation lookups which are rebuilt on demand (see reindex)
+		self.lookups = {}
 		
 		#---open self if the filename exists 
 		#---note that we save parser results but not details from paths.yaml in case these change
-		if os.path.isfile(self.filename): 
-			self.load(previous=previous)
+		if os.path.isfile(self.filename) or (self.store_format=='sqlite' and 
+			os.path.isfile(self.database_filename)): 
+			self.load(previous=previous,lazy=lazy)
 			self.verify()
 		#---otherwise make a new workspace
 		else: self.bootstrap()
@@ -122,12 +203,13 @@ class Workspace():
 		#---paths.yaml specifies directories which might be absent so make them
 		if not os.path.isdir(self.postdir): os.mkdir(self.postdir)
 		if not os.path.isdir(self.plotdir): os.mkdir(self.plotdir)
-		#---parse the simulations found in each "spot"
-		for spot in self.spots: self.treeparser(spot)
+		#---parse the simulations found in each "spot" with a single pass over its directory tree
+		for spotname in unique(zip(*self.spots.keys())[0]): self.treeparser(spotname)
 		#---if there is a part named edr then we use it to get simulation times
 		#---! edr files are required to infer times for slicing however we might also use xtc or trr later
 		assert 'edr' in zip(*self.spots.keys())[1]
 		self.treeparser_edr()
+		self.lookups = {}
 		#---data are stored in dictionaries by spot name
 		all_top_keys = [i for j in [k.keys() for k in self.toc.values()] for i in j]
 
@@ -139,7 +221,56 @@ class Workspace():
 				for spot in self.toc for i in self.toc[spot]}
 		self.save()
 
-	def load(self,previous=True):
+	def __getattr__(self,name):
+
+		"""
+		Unpack a deferred section of the workspace on first access.
+		"""
+
+		deferred = self.__dict__.get('deferred',{})
+		if name not in deferred: raise AttributeError(name)
+		self.__dict__[name] = deferred.pop(name).unpack()
+		return self.__dict__[name]
+
+	def defer(self,name,section,lazy=False):
+
+		"""
+		Attach a section of a saved workspace to self, deferring it if it is packed and lazy is set.
+		"""
+
+		if not isinstance(section,(PackedSection,DeferredSection)): self.__dict__[name] = section
+		elif lazy and name in self.lazy_sections:
+			self.__dict__.pop(name,None)
+			self.deferred[name] = section
+		else: self.__dict__[name] = section.unpack()
+
+	def load(self,previous=True,lazy=False):
+
+		"""
+		Unpack a saved workspace into self.
+		If we are using the database and it is empty we import the workspace pickle once.
+		"""
+
+		if self.store_format=='sqlite':
+			self.database = WorkspaceDatabase(self.database_filename)
+			if not self.database.empty():
+				for key in workspace_sections:
+					if lazy and key in self.lazy_sections: 
+						self.defer(key,DeferredSection(self.database,key),lazy=True)
+					else:
+						val = self.database.load_section(key)
+						if val!=None: self.__dict__[key] = val
+				#---retain the incoming sections for comparison
+				if previous: self.previous = dict([(key,deepcopy(getattr(self,key))) 
+					for key in workspace_sections if hasattr(self,key)])
+				return
+			elif not os.path.isfile(self.filename): return self.bootstrap()
+			status('importing %s into %s'%(self.filename,self.database_filename),tag='work')
+			self.load_pickle(previous=previous)
+			self.save(quiet=True)
+		else: self.load_pickle(previous=previous,lazy=lazy)
+
+	def load_pickle(self,previous=True,lazy=False):
 
 		"""
 		Unpack a saved workspace pickle into self.
@@ -148,13 +279,9 @@ class Workspace():
 		incoming = pickle.load(open(self.filename,'rb'))
 		#---reconstitute things that were bootstrapped
 		#---we do not load spots because e.g. paths might have changed slightly in paths.yaml
-		self.post = incoming.post
-		self.groups = incoming.groups
-		self.slices = incoming.slices
-		self.vars = incoming.vars
-		self.meta = incoming.meta
-		self.calc = incoming.calc
-		self.toc = incoming.toc
+		#---workspaces saved before the manifest was added will be walked completely on refresh
+		for key in ['post','groups','slices','vars','meta','calc','toc','manifest','frames']:
+			self.defer(key,incoming.__dict__.get(key,{}),lazy=lazy)
 
 		#---retain the incoming workspace for comparison
 		if previous: self.previous = incoming
@@ -166,18 +293,37 @@ class Workspace():
 		Saving the workspace obviates the need to check timestamps and parse EDR files every time.
 		Note: future development here will allow the workspace to be fully and quickly reconstituted from
 		clock files saved to disk if the user sets the "timekeeper" option in paths.yaml.
+		If paths.yaml sets "workspace_store: sqlite" we only write the records which changed.
 		"""
 
+		if self.store_format=='sqlite':
+			if not self.database: self.database = WorkspaceDatabase(self.database_filename)
+			if not quiet: status('saving',tag='work')
+			wait = signal.signal(signal.SIGINT,signal.SIG_IGN)
+			changes = self.database.save(dict([(key,self.__dict__[key]) 
+				for key in workspace_sections if key in self.__dict__]))
+			signal.signal(signal.SIGINT,wait)
+			if not quiet: status('done saving (%d records changed)'%changes,tag='work')
+			return
 		#---cannot save lambda functions in pickle
 		detach = deepcopy(self.spots)
 		for spot,details in self.spots.items(): 
 			del details['namer']
 			del details['divy_keys']
 		if not quiet: status('saving',tag='work')
+		#---larger sections are pickled separately so they can be unpacked on first access
+		state = self.__dict__
+		packed = dict([(key,val) for key,val in state.items() if key not in ['deferred','lookups']])
+		for key in self.lazy_sections:
+			if key in self.deferred: packed[key] = self.deferred[key]
+			elif key in state: packed[key] = PackedSection(pickle.dumps(state[key],2))
 		#---ignore interrupts while writing the pickle
 		wait = signal.signal(signal.SIGINT,signal.SIG_IGN)
-		pickle.dump(self,open(self.filename,'wb'))
-		signal.signal(signal.SIGINT,wait)
+		self.__dict__ = packed
+		try: pickle.dump(self,open(self.filename,'wb'))
+		finally: 
+			self.__dict__ = state
+			signal.signal(signal.SIGINT,wait)
 		if not quiet: status('done saving',tag='work')
 		#---reattach the lambda functions after saving
 		self.spots = detach
@@ -228,26 +374,29 @@ class Workspace():
 			need to reconstitute the original filename.
 			"""
 
-			strict = kwargs.get('strict',True)
-			if not spot in self.toc: raise Exception('need a spotname to look up keys')
-			#---! it may be worth storing this as a function a la divy_keys
-			#---follow the top,step,part naming convention
-			try:
-				backwards = [''.join(['%s' if i[0]=='subpattern' else chr(i[1]) 
-					for i in re.sre_parse.parse(regex)]) 
-					for regex in [self.spots[spot][key] for key in ['top','step','part']]]
-				fn = os.path.join(
-					self.spots[spot]['rootdir'],
-					'/'.join([backwards[ii]%i for ii,i in enumerate(args)]))
-			except Exception as e: 
-				tracer(e)
-				#---previously: raise Exception('error making keys: %s,%s'%(str(spotname),str(args)))
-				import pdb;pdb.set_trace() #---legit
-			if strict: assert os.path.isfile(fn)
-			return fn
+			return self.keys_to_filenames([args],spot=spot,strict=kwargs.get('strict',True))[0]
 
 		return keys_to_filename
 
+	def keys_to_filenames(self,keylist,spot=None,strict=True):
+
+		"""
+		Reconstitute the original filenames for a list of (top,step,part) keys in one call.
+		The templates for the top,step,part naming convention are compiled once per spot in __init__.
+		"""
+
+		spot = self.cursor if not spot else spot
+		if not spot in self.spots: raise Exception('need a spotname to look up keys')
+		templates,rootdir = self.spots[spot]['templates'],self.spots[spot]['rootdir']
+		try: fns = [os.path.join(rootdir,'/'.join([templates[ii]%i for ii,i in enumerate(keys)])) 
+			for keys in keylist]
+		except Exception as e: 
+			tracer(e)
+			#---previously: raise Exception('error making keys: %s,%s'%(str(spotname),str(args)))
+			import pdb;pdb.set_trace() #---legit
+		if strict: assert all([os.path.isfile(fn) for fn in fns])
+		return fns
+
 	def divy_keys(self,spot):
 
 		"""
@@ -256,14 +405,27 @@ class Workspace():
 		strings if there is only one part. The resulting regex groups serve as keys in the toc.
 		"""
 
-		group_counts = [sum([i[0]=='subpattern' 
-			for i in re.sre_parse.parse(self.spots[spot][key])]) 
-			#---apply naming convention
-			for key in ['top','step','part']]
-		cursor = ([0]+[sum(group_counts[:i+1]) for i in range(len(group_counts))])
-		slices = [slice(cursor[i],cursor[i+1]) for i in range(len(cursor)-1)]
-		divy = lambda x: [y[0] if len(y)==1 else y for y in [x[s] for s in slices]]
-		return divy
+		#---apply naming convention
+		return regex_divider(*[self.spots[spot][key] for key in ['top','step','part']])
+
+	def reindex(self,name):
+
+		"""
+		Return a reverse index for simulation lookups, building it from the workspace if necessary.
+		The "spotnames" index maps simulation names to the toc spots which contain them.
+		The "slices" index maps simulation and part names to keys in the slices dictionary.
+		Indexes are discarded when the toc or slices are rebuilt, and are never saved.
+		"""
+
+		if name in self.lookups: return self.lookups[name]
+		index = self.lookups[name] = {}
+		if name=='spotnames':
+			for spot,tree in self.toc.items():
+				for sn in tree: index.setdefault(sn,[]).append(spot)
+		elif name=='slices':
+			for key in self.slices: index.setdefault((key[1],key[0][1]),[]).append(key)
+		else: raise Exception('[ERROR] unknown lookup "%s"'%name)
+		return index
 
 	def spotname_lookup(self,sn):
 
@@ -272,7 +434,7 @@ class Workspace():
 		"""
 
 		assert type(sn)==str
-		spotnames = [key for key,val in self.toc.items() if sn in val]
+		spotnames = list(self.reindex('spotnames').get(sn,[]))
 		if not spotnames: raise Exception('[ERROR] could not find simulation "%s" in the toc'%sn)
 		spotnames_unique = list(set(zip(*spotnames)[0]))
 		if len(spotnames_unique) != 1: 
@@ -297,25 +459,93 @@ class Workspace():
 		
 	###---DATASET PARSER
 
-	def treeparser(self,spot):
+	def treewalk_subtree(self,rootdir,previous,recursive=True):
+
+		"""
+		List a directory tree using the manifest.
+		The manifest records the modification time and the contents of every directory so that we only list 
+		directories which have changed since the last parsing. Entries are returned in walk order.
+		"""
+
+		entries = collections.OrderedDict()
+		pending = [rootdir]
+		while pending:
+			dirpath = pending.pop(0)
+			try: mtime = os.stat(dirpath).st_mtime
+			except OSError: continue
+			entry = previous.get(dirpath,None)
+			if not entry or entry['mtime']==None or entry['mtime']!=mtime:
+				try: names = sorted(os.listdir(dirpath))
+				except OSError: continue
+				#---isdir follows symlinks in the same way as os.walk with followlinks
+				dirs = [i for i in names if os.path.isdir(os.path.join(dirpath,i))]
+				#---directories modified in the last few seconds could change within the mtime resolution
+				if time.time()-mtime<2.0: mtime = None
+				entry = {'mtime':mtime,'dirs':dirs,'files':[i for i in names if i not in dirs],'matches':{}}
+			entries[dirpath] = entry
+			if recursive: pending.extend([os.path.join(dirpath,i) for i in entry['dirs']])
+		return entries
+
+	def treewalk(self,rootdir):
+
+		"""
+		Walk a spot directory and return its contents according to the manifest (see treewalk_subtree).
+		The top-level (simulation) directories are walked concurrently because listing directories on 
+		network filesystems is limited by latency rather than bandwidth.
+		"""
+
+		previous = self.manifest.get(rootdir,{})
+		top = self.treewalk_subtree(rootdir,previous,recursive=False)
+		if rootdir not in top: return top
+		subdirs = [os.path.join(rootdir,i) for i in top[rootdir]['dirs']]
+		nthreads = max(1,min(len(subdirs),self.machine.get('scan_threads',self.scan_threads)))
+		pool = ThreadPool(nthreads)
+		try: subtrees = pool.map(lambda x:self.treewalk_subtree(x,previous),subdirs)
+		finally: pool.close()
+		entries = collections.OrderedDict([(rootdir,top[rootdir])])
+		for subtree in subtrees: entries.update(subtree)
+		#---directories which have disappeared are dropped from the manifest
+		self.manifest[rootdir] = entries
+		return entries
+
+	def treeparser(self,spotname):
 
 		"""
 		This function parses simulation data which are organized into a "spot". 
-		It writes the filenames to the table of contents (self.toc).
+		It writes the filenames to the table of contents (self.toc) for every part in the spot.
+		We list each directory once and test all of the part regexes together. Only directories which have 
+		changed since the previous parsing are listed (see treewalk) and we reuse the regex matches for 
+		unchanged directories.
 		"""
 
-		spot_sub = self.spots[spot]
-		rootdir = spot_sub['rootdir']
-		#---start with all files under rootdir
-		fns = [os.path.join(dirpath,fn) 
-			for (dirpath, dirnames, filenames) 
-			in os.walk(rootdir,followlinks=True) for fn in filenames]
+		spots = [spot for spot in self.spots if spot[0]==spotname]
+		rootdir = self.spots[spots[0]]['rootdir']
 		#---regex combinator is the only place where we enforce a naming convention via top,step,part
 		#---note that we may wish to generalize this depending upon whether it is wise to have three parts
-		regex = ('^%s\/'%re.escape(rootdir.rstrip('/'))+
-			'\/'.join([spot_sub['top'],spot_sub['step'],spot_sub['part']])
-			+'$')
-		matches_raw = [i.groups() for fn in fns for i in [re.search(regex,fn)] if i]
+		regexes = collections.OrderedDict([(spot,('^%s\/'%re.escape(rootdir.rstrip('/'))+
+			'\/'.join([self.spots[spot]['top'],self.spots[spot]['step'],self.spots[spot]['part']])
+			+'$')) for spot in spots])
+		regexes_compiled = dict([(regex,re.compile(regex)) for regex in regexes.values()])
+		matches_raw = dict([(spot,[]) for spot in spots])
+		for dirpath,entry in self.treewalk(rootdir).items():
+			#---cached matches are keyed by the regex in case the user changes paths.yaml
+			missing = [regex for regex in regexes_compiled if regex not in entry['matches']]
+			for regex in missing: entry['matches'][regex] = []
+			if missing:
+				for fn in entry['files']:
+					path = os.path.join(dirpath,fn)
+					for regex in missing:
+						match = regexes_compiled[regex].search(path)
+						if match: entry['matches'][regex].append(match.groups())
+			for spot,regex in regexes.items(): matches_raw[spot].extend(entry['matches'][regex])
+		for spot in spots: self.treeparser_toc(spot,matches_raw[spot])
+
+	def treeparser_toc(self,spot,matches_raw):
+
+		"""
+		Organize the regex matches for one part of a spot into the table of contents.
+		"""
+
 		if not matches_raw: 
 			status('no matches found for spot: "%s,%s"'%spot,tag='warning')
 			return
@@ -324,18 +554,9 @@ class Workspace():
 		#---the top two levels of the toc correspond to the top and step signifiers
 		#---note that this procedure projects the top,step,part naming convention into the toc
 		matches = [self.spots[spot]['divy_keys'](i) for i in matches_raw]
-		self.toc[spot] = collections.OrderedDict()
-		#---sort the tops into an ordered dictionary
-		for top in sorted(set(zip(*matches)[0])): 
-			self.toc[spot][top] = collections.OrderedDict()
-		#---collect unique steps for each top and load them with the parts
-		for top in self.toc[spot]:
-			#---sort the steps into an ordered dictionary
-			for step in sorted(set([i[1] for i in matches if i[0]==top])):
-				#---we sort the parts into an ordered dictionary
-				#---this is the leaf of the toc tree and we use dictionaries
-				parts = sorted([i[2] for i in matches if i[0]==top and i[1]==step])
-				self.toc[spot][top][step] = collections.OrderedDict([(part,{}) for part in parts])
+		#---the parts are the leaves of the toc tree and we use dictionaries
+		self.toc[spot] = treebucket(matches)
+		self.lookups.pop('spotnames',None)
 		#---now the toc is prepared with filenames but subsequent parsings will identify EDR files
 
 	def treeparser_edr(self):
@@ -349,19 +570,68 @@ class Workspace():
 		#---prepare a list of edr files to parse first
 		targets = []
 		for spot in spots_edr:
-			for sn in self.toc[spot].keys():
-				steps = self.toc[spot][sn].keys()
-				for step in steps:
-					parts = self.toc[spot][sn][step].keys()
-					for part in parts:
-						fn = self.keyfinder(spot)(sn,step,part)
-						keys = (spot,sn,step,part)
-						targets.append((fn,keys))
-		for ii,(fn,keys) in enumerate(targets):
-			status('scanning EDR files',i=ii,looplen=len(targets),tag='scan')
-			times = edrcheck(fn)
-			leaf = delve(self.toc,*keys)
-			leaf['start'],leaf['stop'] = times
+			keylist = [(sn,step,part) for sn in self.toc[spot] 
+				for step in self.toc[spot][sn] for part in self.toc[spot][sn][step]]
+			#---files were found by the treeparser so we check them when we consult the cache below
+			fns = self.keys_to_filenames(keylist,spot=spot,strict=False)
+			targets.extend([(fn,(spot,)+keys) for fn,keys in zip(fns,keylist)])
+		#---consult the cache of EDR times keyed by path, size, and modification time
+		cache_fn = os.path.join(self.postdir,self.edr_cache_fn)
+		if os.path.isfile(cache_fn):
+			with open(cache_fn) as fp: cache = json.loads(fp.read())
+		else: cache = {}
+		pending = []
+		for fn,keys in targets:
+			try: 
+				stat = os.stat(fn)
+				identity = [stat.st_size,stat.st_mtime]
+			except OSError: identity = None
+			if identity and fn in cache and cache[fn][:2]==identity:
+				leaf = delve(self.toc,*keys)
+				leaf['start'],leaf['stop'] = cache[fn][2:]
+			else: pending.append((fn,keys,identity))
+		if targets: 
+			status('found %d/%d EDR files in the cache'%(len(targets)-len(pending),len(targets)),tag='scan')
+		#---each edrcheck is an independent subprocess so we distribute them over a pool of processes
+		#---imap returns results in the order of the targets so the toc is written deterministically
+		nprocs = max(1,min(self.nprocs,len(pending)))
+		if nprocs>1: 
+			pool = multiprocessing.Pool(nprocs)
+			scans = pool.imap(edrcheck,zip(*pending)[0],chunksize=1)
+		else: scans = itertools.imap(edrcheck,[fn for fn,keys,identity in pending])
+		try:
+			for ii,((fn,keys,identity),times) in enumerate(itertools.izip(pending,scans)):
+				status('scanning EDR files',i=ii,looplen=len(pending),tag='scan')
+				leaf = delve(self.toc,*keys)
+				leaf['start'],leaf['stop'] = times
+				if identity: cache[fn] = identity+list(times)
+		finally:
+			if nprocs>1: 
+				pool.close()
+				pool.join()
+			#---write the cache even if we were interrupted so the completed scans are retained
+			if pending:
+				with open(cache_fn+'.tmp','w') as fp: fp.write(json.dumps(cache))
+				os.rename(cache_fn+'.tmp',cache_fn)
+
+	def frame_index(self,fn):
+
+		"""
+		Return the byte offsets and times of the frames in an XTC file.
+		The index is built by reading only the frame headers and is stored in the workspace alongside the toc
+		until the size or modification time of the file changes. Returns None if we cannot parse the file.
+		"""
+
+		fn = os.path.abspath(fn)
+		try: stat = os.stat(fn)
+		except OSError: return None
+		identity = (stat.st_size,stat.st_mtime)
+		if fn in self.frames and self.frames[fn]['identity']==identity: return self.frames[fn]
+		index = xtc_index(fn) if re.match('^.+\.xtc$',fn) else None
+		if index==None: return None
+		index['identity'] = identity
+		self.frames[fn] = index
+		return index
 
 	def get_timeseries(self,sn,strict=False,**kwargs):
 
@@ -389,6 +659,25 @@ class Workspace():
 		#	if not strict or (None not in self.edr_times[self.xtc_files.index(fn)])]
 		#return seq_time_fn
 
+	def get_frametimes(self,sn):
+
+		"""
+		Collect the frame times for each trajectory part of a simulation from the frame index.
+		Returns a list of keys and times in trajectory order or None if any part cannot be indexed.
+		Parts which are missing from disk are skipped as they are when slicing by the EDR times.
+		"""
+
+		spot = (self.c,self.trajectory_format)
+		tree = self.toc[spot][sn]
+		frametimes = []
+		keylist = [(sn,step,part) for step in tree for part in tree[step]]
+		for keys,fn in zip(keylist,self.keys_to_filenames(keylist,spot=spot,strict=False)):
+			if not os.path.isfile(fn): continue
+			index = self.frame_index(fn)
+			if index==None: return None
+			frametimes.append((keys,index['times']))
+		return frametimes
+
 	def get_last_start_structure(self,sn,part_name='structure'):
 	
 		"""
@@ -397,8 +686,13 @@ class Workspace():
 		Note that this function needs to be renamed since it can also get TPR files.
 		"""
 		
+		#---structures are cached for the session because group creation asks for them repeatedly
+		cached = self.lookups.setdefault('structures',{}).get((self.c,sn,part_name),None)
+		if cached:
+			self.cursor = (self.c,part_name)
+			return cached
 		#---call slice to move the cursor
-		keys_to_sn = [key for key in self.slices.keys() if key[1]==sn and key[0][1]==part_name]
+		keys_to_sn = list(self.reindex('slices').get((sn,part_name),[]))
                 if keys_to_sn==[]:
                         last_tpr=self.get_last_start_structure(sn,part_name='tpr')
                         last_traj=self.get_last_start_structure(sn,part_name=self.trajectory_format)
@@ -409,7 +703,9 @@ class Workspace():
                                 tail = ' -dump %d -s %s -f %s -o system.gro'%(dump_time,last_tpr,last_traj)
                                 call(gmxpaths['trjconv']+tail,cwd=cwd,inpipe='0\n',logfile='log-trjconv-system-make_gro')
                         #---add the newly-created system.gro to the toc even if it doesn't use the structure regex
-                        if sn not in self.toc[(self.c,part_name)]: self.toc[(self.c,part_name)][sn] = collections.OrderedDict()
+                        if sn not in self.toc[(self.c,part_name)]: 
+                                self.toc[(self.c,part_name)][sn] = collections.OrderedDict()
+                                self.reindex('spotnames').setdefault(sn,[]).append((self.c,part_name))
                         step = self.toc[(self.c,'tpr')][sn].items()[-1][0]
                         self.toc[(self.c,part_name)][sn][step] = collections.OrderedDict()
                         self.toc[(self.c,part_name)][sn][step][('system','gro')] = {}
@@ -420,7 +716,9 @@ class Workspace():
 		#---since structures should be equivalent we take the first
 		structure = structures.keys()[0]
 		keys = sn,step,structure
-		return self.keyfinder()(*keys)
+		fn = self.keyfinder()(*keys)
+		self.lookups['structures'][(self.c,sn,part_name)] = fn
+		return fn
 
 	def confirm_file(self,fn):
 	
@@ -462,20 +760,56 @@ class Workspace():
 				self.groups[sn][name] = {'fn':fn,'select':select}
 			return
 		status('creating group %s'%simkey,tag='status')
-		#---read the structure
-		uni = gmxread(self.get_last_start_structure(sn))
-		sel = mdasel(uni,select)
-		#---write NDX 
-		import numpy as np
-		iii = sel.indices+1	
-		rows = [iii[np.arange(cols*i,cols*(i+1) if cols*(i+1)<len(iii) else len(iii))] 
-			for i in range(0,len(iii)/cols+1)]
+		#---the selection is cached and otherwise we read the structure once for all groups in this simulation
+		iii = self.selection(sn,select)+1
+		full = len(iii)/cols*cols
 		with open(self.postdir+fn,'w') as fp:
 			fp.write('[ %s ]\n'%name)
-			for line in rows:
-				fp.write(' '.join(line.astype(str))+'\n')
+			if full: fp.write((' '.join(['%d']*cols)+'\n')*(full/cols)%tuple(iii[:full]))
+			if len(iii)>full: fp.write(' '.join(iii[full:].astype(str))+'\n')
 		self.groups[sn][name] = {'fn':fn,'select':select}
 
+	def structure_universe(self,sn=None,structure=None):
+
+		"""
+		Read the reference structure for a simulation (or a structure file) once for all of its groups.
+		We only hold one structure at a time (see slice_simulation).
+		"""
+
+		structure = self.get_last_start_structure(sn) if structure==None else structure
+		cached = self.lookups.get('universe',None)
+		if cached and cached[0]==structure: return cached[1]
+		uni = gmxread(structure)
+		self.lookups['universe'] = (structure,uni)
+		return uni
+
+	def selection(self,target,select):
+
+		"""
+		Return the (zero-based) atom indices for an MDAnalysis selection on a simulation or a structure file.
+		The target is a simulation name, in which case we use its reference structure, or the path to a 
+		structure e.g. the grofile sent to a calculation. Results are stored in the post directory keyed by 
+		the path, size, and modification time of the structure and the selection string, so repeated 
+		selections are read from a memory-mapped array instead of parsing the structure. 
+		"""
+
+		if target in self.reindex('spotnames'): structure = self.get_last_start_structure(target)
+		else: structure = target
+		structure = os.path.abspath(structure)
+		stat = os.stat(structure)
+		cache_dir = os.path.join(self.postdir,self.selection_cache_dir)
+		fn = os.path.join(cache_dir,'%s.npy'%spechash([structure,stat.st_size,stat.st_mtime,select]))
+		if os.path.isfile(fn): return np.load(fn,mmap_mode='r')
+		indices = mdasel(self.structure_universe(structure=structure),select).indices.astype(np.int32)
+		#---the forked slice workers may make the directory at the same time
+		try: os.mkdir(cache_dir)
+		except OSError as e: 
+			if e.errno!=errno.EEXIST: raise
+		tmp = '%s.tmp%d'%(fn,os.getpid())
+		with open(tmp,'wb') as fp: np.save(fp,indices)
+		os.rename(tmp,fn)
+		return indices
+
 	def slice(self,sn,**kwargs):
 
 		"""
@@ -488,7 +822,7 @@ class Workspace():
 		self.cursor = kwargs.get('spot',self.cursor)
 		part_name = kwargs.get('part_name',self.cursor[1])
 		#---search for the simulation in all spots
-		keys_to_sn = [key for key in self.slices.keys() if key[1]==sn and key[0][1]==part_name]
+		keys_to_sn = self.reindex('slices').get((sn,part_name),[])
 		if len(keys_to_sn)>1: raise Exception('found simulation %s in multiple spots!'%sn)
 		elif not keys_to_sn: 
 			raise Exception('failed to find slice key for sn "%s" and part "%s". '%(sn,part_name)+
@@ -517,14 +851,23 @@ class Workspace():
 		group = kwargs['group']
 		slice_name = kwargs['slice_name']
 		pbc = kwargs['pbc'] if 'pbc' in kwargs else None
-		pbc_suffix = '' if not pbc else '.pbc%s'%pbc
-		outkey = '%s.%d-%d-%d.%s%s'%(self.prefixer(sn),start,end,skip,group,pbc_suffix)
+		outkey = self.slice_outkey(sn,start,end,skip,group,pbc)
 		grofile,trajfile = outkey+'.gro',outkey+'.'+self.trajectory_format
 		#---make the slice only if necessary
 		both_there = all([os.path.isfile(self.postdir+fn) for fn in [grofile,trajfile]])
 		self.slice(sn,part_name=self.trajectory_format)
 		if both_there and slice_name in self.slice(sn) and group in self.slice(sn)[slice_name]: return
-		if not both_there or not all([self.confirm_file(self.postdir+fn) for fn in [grofile,trajfile]]):
+		if not both_there and self.slice_failed(sn,slice_name,group,outkey,retry=kwargs.get('retry',False)):
+			status('skipping slice %s which failed before with the same inputs '%outkey+
+				'(use "make compute retry" to try again)',tag='warning')
+			return
+		#---slices made by create_slices_together in this session do not need confirmation
+		fresh = outkey in self.lookups.get('fresh_slices',set())
+		if not both_there or not (fresh or 
+			all([self.confirm_file(self.postdir+fn) for fn in [grofile,trajfile]])):
+			#---a missing group is not a problem with the inputs so we raise without recording a failed slice
+			if group not in self.groups.get(sn,{}):
+				raise Exception('[ERROR] cannot make slice %s because group %s is missing'%(outkey,group))
 			status('making slice: %s'%outkey,tag='status')
 			#---slice is not there or not confirmed so we make a new one here
 			sequence = self.get_timeseries(sn,strict=False)
@@ -532,11 +875,24 @@ class Workspace():
 			#---assume the tpr part exists
 			tpr_toc = self.toc[(self.c,'tpr')]
 			try:
+				frametimes = self.get_frametimes(sn)
+				#---narrower or thinner slices are made from a larger slice instead of the original parts
+				superset = self.find_superset_slice(sn,start,end,skip,group,pbc)
+				if superset: self.derive_slice(sn,outkey,start,end,skip,group,superset)
+				elif self.slice_engine=='numpy' and not pbc and frametimes!=None:
+					structure = self.get_last_start_structure(sn)
+					self.slice(sn,part_name=self.trajectory_format)
+					slice_trajectory_numpy(start,end,skip,frametimes,[(outkey,self.groups[sn][group]['fn'])],
+						self.postdir,structure,
+						traj_keyfinder=self.keyfinder((self.c,self.trajectory_format)))
 				#---! note that we force xtc below and this needs a solution ASAP!
-				slice_trajectory(start,end,skip,sequence,outkey,self.postdir,
+				else: slice_trajectory(start,end,skip,sequence,outkey,self.postdir,
 					tpr_keyfinder=self.keyfinder((self.c,'tpr')),
 					traj_keyfinder=self.keyfinder((self.c,self.trajectory_format)),
-                                        group_fn=self.groups[sn][group]['fn'],pbc=pbc)
+                                        group_fn=self.groups[sn][group]['fn'],pbc=pbc,
+					frametimes=frametimes,
+					nthreads=self.machine.get('trjconv_threads',self.trjconv_threads),
+					scratch=self.scratchdir)
 			except KeyboardInterrupt: raise Exception('[ERROR] cancelled by user')
 			except Exception as e:
 				#---the following exception handler allows the code to continue to slice in case
@@ -552,9 +908,11 @@ class Workspace():
 				status(re.sub('\n','\n[TRACEBACK] ',traceback.format_exc()),tag='traceback')
 				status('failed to make slice: '+outkey,tag='error')
 				if slice_name not in self.slice(sn): self.slice(sn)[slice_name] = {}
+				#---we record the inputs so that we only retry the slice when they change
 				self.slice(sn)[slice_name][group] = {'start':start,'end':end,'skip':skip,
 					'group':group,'pbc':pbc,'verified':False,'filekey':outkey,
-					'gro':grofile,self.trajectory_format:trajfile,'missing_frame_percent':100.}
+					'gro':grofile,self.trajectory_format:trajfile,'missing_frame_percent':100.,
+					'failed':{'fingerprint':self.slice_fingerprint(sn,group),'error':str(e)}}
 				status('returning from this function but otherwise passing',tag='error')			
 				return
 		print '[STATUS] checking timestamps of slice: %s'%outkey
@@ -573,6 +931,194 @@ class Workspace():
 			'group':group,'pbc':pbc,'verified':verified,'timeseries':timeseries,'filekey':outkey,
 			'gro':grofile,self.trajectory_format:trajfile,'missing_frame_percent':missing_frame_percent}
 
+	def slice_simulation(self,sn,root,retry=False):
+
+		"""
+		Create the groups and slices in the specs for one simulation.
+		Returns a list of the groups and slices which failed so that action can report them.
+		The retry flag makes slices which failed before with the same inputs.
+		"""
+
+		errors = []
+		#---create groups
+		if 'groups' in root:
+			for group,select in root['groups'].items():
+				kwargs = {'group':group,'select':select,'sn':sn}
+				try: self.create_group(**kwargs)
+				except KeyboardInterrupt: raise
+				except Exception as e: 
+					status('failed to make group %s for %s: %s'%(group,sn,e),tag='error')
+					errors.append((sn,'group',group,str(e)))
+			#---release the structure which was read for these groups
+			self.lookups.pop('universe',None)
+			root.pop('groups')
+		#---slice the trajectory
+		if 'slices' in root:
+			for sl,details in root['slices'].items(): 
+				#---the numpy engine makes all groups for a slice in one pass
+				try: self.create_slices_together(sn,sl,details,retry=retry)
+				except KeyboardInterrupt: raise
+				except Exception as e: status('failed to make slices for %s: %s'%(sn,e),tag='warning')
+				#---! use a default group here?
+				for group in details['groups']:
+					kwargs = {'sn':sn,'start':details['start'],
+						'end':details['end'],'skip':details['skip'],'slice_name':sl}
+					kwargs['group'] = group
+					if 'pbc' in details: kwargs['pbc'] = details['pbc']
+					kwargs['retry'] = retry
+					try: 
+						self.create_slice(**kwargs)
+						#---create_slice handles failures in the slicer by recording a failed slice
+						record = self.slice(sn).get(sl,{}).get(group,{})
+						if record.get('missing_frame_percent',0.)==100. and not record.get('verified',True):
+							errors.append((sn,sl,group,'slicer failed for %s'%record['filekey']))
+					except KeyboardInterrupt: raise
+					except Exception as e:
+						status('failed to make slice %s,%s for %s: %s'%(sl,group,sn,e),tag='error')
+						errors.append((sn,sl,group,str(e)))
+			root.pop('slices')
+		if root != {}: raise Exception('[ERROR] unprocessed specifications %s'%str(root))
+		return errors
+
+	def slice_toc_keys(self,sn):
+
+		"""
+		List the parts for a simulation in each spot so we can tell when slicing adds parts to the toc.
+		"""
+
+		return dict([(spot,[(step,part) for step in self.toc[spot][sn] for part in self.toc[spot][sn][step]])
+			for spot in self.toc if sn in self.toc[spot]])
+
+	def slice_merge(self,sn,changes):
+
+		"""
+		Merge the groups and slices made for one simulation by a slice_worker.
+		"""
+
+		self.groups[sn] = changes['groups']
+		self.slices.update(changes['slices'])
+		self.frames.update(changes['frames'])
+		for spot,tree in changes['toc'].items(): self.toc[spot][sn] = tree
+		if changes['toc']: self.lookups.pop('spotnames',None)
+		return changes['errors']
+
+	def slice_fingerprint(self,sn,group=None):
+
+		"""
+		Fingerprint the trajectory and tpr parts of a simulation and the group NDX file for a slice by path, 
+		size, and modification time.
+		"""
+
+		identities = []
+		if group in self.groups.get(sn,{}):
+			fn = self.postdir+self.groups[sn][group]['fn']
+			try: 
+				stat = os.stat(fn)
+				identities.append([fn,stat.st_size,stat.st_mtime])
+			except OSError: identities.append([fn,None,None])
+		for spot in [(self.c,self.trajectory_format),(self.c,'tpr')]:
+			if spot not in self.toc or sn not in self.toc[spot]: continue
+			tree = self.toc[spot][sn]
+			keylist = [(sn,step,part) for step in tree for part in tree[step]]
+			for fn in self.keys_to_filenames(keylist,spot=spot,strict=False):
+				try: 
+					stat = os.stat(fn)
+					identities.append([fn,stat.st_size,stat.st_mtime])
+				except OSError: identities.append([fn,None,None])
+		return spechash(identities)
+
+	def slice_failed(self,sn,slice_name,group,outkey,retry=False):
+
+		"""
+		Check whether a slice failed before with the same inputs so we can skip it unless we retry.
+		The outkey holds the times, group, and pbc so that changing the slice in the specs makes a new attempt.
+		"""
+
+		record = self.slice(sn,part_name=self.trajectory_format).get(slice_name,{}).get(group,{})
+		if retry or 'failed' not in record or record['filekey']!=outkey: return False
+		return record['failed']['fingerprint']==self.slice_fingerprint(sn,group)
+
+	def slice_outkey(self,sn,start,end,skip,group,pbc=None):
+
+		"""
+		Name a slice by the simulation, times, group, and pbc.
+		"""
+
+		pbc_suffix = '' if not pbc else '.pbc%s'%pbc
+		return '%s.%d-%d-%d.%s%s'%(self.prefixer(sn),start,end,skip,group,pbc_suffix)
+
+	def find_superset_slice(self,sn,start,end,skip,group,pbc=None):
+
+		"""
+		Find the smallest verified slice which contains every frame of a new slice so we can subsample it.
+		The superset must have the same pbc and either the same group or the group "all" (if it selects all 
+		atoms), its window must contain the new window, and its skip must divide the new skip and the offset.
+		"""
+
+		all_atoms = self.groups[sn].get('all',{}).get('select',None)=='all'
+		candidates = []
+		for slice_name,records in self.slice(sn,part_name=self.trajectory_format).items():
+			for name,record in records.items():
+				if not record.get('verified',False) or record.get('pbc',None)!=pbc: continue
+				if not (name==group or (name=='all' and all_atoms and group in self.groups[sn])): continue
+				if record['start']>start or record['end']<end: continue
+				if skip%record['skip']!=0 or (start-record['start'])%record['skip']!=0: continue
+				if record['filekey']==self.slice_outkey(sn,start,end,skip,group,pbc): continue
+				fns = [self.postdir+record[i] for i in ['gro',self.trajectory_format]]
+				if not all([os.path.isfile(fn) for fn in fns]): continue
+				candidates.append((os.path.getsize(fns[1]),name!=group,record))
+		return min(candidates)[-1] if candidates else None
+
+	def derive_slice(self,sn,outkey,start,end,skip,group,superset):
+
+		"""
+		Make a slice by subsampling a larger slice found by find_superset_slice.
+		"""
+
+		status('making slice %s from %s'%(outkey,superset['filekey']),tag='status')
+		group_fn = None if superset['group']==group else self.groups[sn][group]['fn']
+		trajfile = self.postdir+superset[self.trajectory_format]
+		#---the numpy engine only selects frames and atoms so it can subsample slices with pbc
+		index = self.frame_index(trajfile) if self.slice_engine=='numpy' else None
+		if index!=None:
+			slice_trajectory_numpy(start,end,skip,[((sn,),index['times'])],[(outkey,group_fn)],
+				self.postdir,self.postdir+superset['gro'],traj_keyfinder=lambda *keys:trajfile)
+		else: subsample_slice(start,end,skip,superset['filekey'],outkey,self.postdir,
+			group_fn=group_fn,output_format=self.trajectory_format)
+
+	def create_slices_together(self,sn,slice_name,details,retry=False):
+
+		"""
+		Make the missing slices for several groups with one read of the trajectory via the numpy engine.
+		Each slice is then validated and recorded by create_slice, which also retries any that failed here.
+		"""
+
+		pbc = details.get('pbc',None)
+		if self.slice_engine!='numpy' or pbc: return
+		self.slice(sn,part_name=self.trajectory_format)
+		frametimes = self.get_frametimes(sn)
+		if frametimes==None: return
+		targets = []
+		for group in details['groups']:
+			outkey = self.slice_outkey(sn,details['start'],details['end'],details['skip'],group)
+			if group in self.groups[sn] and not all([os.path.isfile(self.postdir+outkey+'.'+suffix) 
+				for suffix in ['gro',self.trajectory_format]]) and not self.find_superset_slice(
+				sn,details['start'],details['end'],details['skip'],group) and not self.slice_failed(
+				sn,slice_name,group,outkey,retry=retry):
+				targets.append((outkey,self.groups[sn][group]['fn']))
+		if len(targets)<2: return
+		status('making slices: %s'%', '.join(zip(*targets)[0]),tag='status')
+		structure = self.get_last_start_structure(sn)
+		self.slice(sn,part_name=self.trajectory_format)
+		try:
+			slice_trajectory_numpy(details['start'],details['end'],details['skip'],frametimes,targets,
+				self.postdir,structure,traj_keyfinder=self.keyfinder((self.c,self.trajectory_format)))
+		except KeyboardInterrupt: raise Exception('[ERROR] cancelled by user')
+		except Exception as e:
+			status('failed to make slices together so we make them separately: %s'%e,tag='warning')
+			return
+		self.lookups.setdefault('fresh_slices',set()).update(zip(*targets)[0])
+
 	def slice_timeseries(self,grofile,trajfile,**kwargs):
 
 		"""
@@ -595,8 +1141,12 @@ class Workspace():
 			dat = load(timefile,path=self.postdir)
 			timeseries = dat['timeseries']
 		else:
-			uni = gmxread(*[os.path.abspath(i) for i in [grofile,trajfile]])
-			timeseries = [uni.trajectory[fr].time for fr in range(len(uni.trajectory))]
+			#---read times from the frame headers instead of decompressing the trajectory if possible
+			index = self.frame_index(trajfile)
+			if index!=None: timeseries = list(index['times'])
+			else:
+				uni = gmxread(*[os.path.abspath(i) for i in [grofile,trajfile]])
+				timeseries = [uni.trajectory[fr].time for fr in range(len(uni.trajectory))]
 			if diskwrite: 
 				store({'timeseries':timeseries},timefile,self.postdir,
 					attrs=None,print_types=False,verbose=True)
@@ -726,22 +1276,134 @@ class Workspace():
 		#---return all simulations for the current cursor, already sorted by the treeparser and ordered dict
 		else: return self.sns()
 
+	def postdata_index(self):
+
+		"""
+		Index the spec files in the post directory by their base name and the hash of their specs.
+		The index is stored as a journal in the post directory. We only list the post directory when its 
+		modification time differs from the journal, and then we only read the new spec files. The computer 
+		adds the spec files it writes via postdata_register.
+		"""
+
+		index = self.lookups.get('postdata',None)
+		index_fn = os.path.join(self.postdir,self.postdata_index_fn)
+		if index==None:
+			index = self.lookups['postdata'] = {'mtime':None,'specs':{},'bases':{}}
+			if os.path.isfile(index_fn):
+				with open(index_fn) as fp:
+					for line in fp:
+						try: record = json.loads(line)
+						#---ignore a partial line from an interrupted write
+						except ValueError: continue
+						if 'mtime' in record: index['mtime'] = record['mtime']
+						else: self.postdata_add(index,record)
+		mtime = os.stat(self.postdir).st_mtime
+		if mtime==index['mtime']: return index
+		status('indexing spec files in %s'%self.postdir,tag='status')
+		names = set([os.path.basename(i) for i in glob.glob(self.postdir+'*.spec')])
+		for name in [i for i in index['specs'] if i not in names]: self.postdata_add(index,name,remove=True)
+		for name in sorted([i for i in names if i not in index['specs']]):
+			try:
+				with open(self.postdir+name) as fp: attrs = json.loads(fp.read())
+			except ValueError: continue
+			self.postdata_add(index,{'spec':name,'hash':spechash(attrs),'attrs':attrs})
+		#---rewrite the journal after listing the directory and record the mtime after the rename
+		with open(index_fn+'.tmp','w') as fp:
+			for record in index['specs'].values(): fp.write(json.dumps(record)+'\n')
+		os.rename(index_fn+'.tmp',index_fn)
+		index['mtime'] = self.postdata_mtime()
+		with open(index_fn,'a') as fp: fp.write(json.dumps({'mtime':index['mtime']})+'\n')
+		return index
+
+	def postdata_mtime(self):
+
+		"""
+		Get the modification time of the post directory for the postdata index.
+		Directories modified in the last few seconds could change within the mtime resolution so we return 
+		None which makes the next lookup list the directory again (see treewalk_subtree).
+		"""
+
+		mtime = os.stat(self.postdir).st_mtime
+		return None if time.time()-mtime<2.0 else mtime
+
+	def postdata_add(self,index,record,remove=False):
+
+		"""
+		Add a spec file record to the postdata index or remove it by name.
+		Spec files are named according to a base name and a suffix with the index number or the hash.
+		"""
+
+		name = record if remove else record['spec']
+		base = re.sub('\.(n[0-9]+|h[0-9a-f]{32})\.spec$','',name)
+		base = re.sub('\.spec$','',base)
+		#---later records in the journal replace earlier ones
+		if name in index['specs']:
+			index['bases'][base][index['specs'].pop(name)['hash']].remove(name)
+		if not remove:
+			index['specs'][name] = record
+			index['bases'].setdefault(base,{}).setdefault(record['hash'],[]).append(name)
+
+	def postdata_register(self,name,attrs,mtime=None):
+
+		"""
+		Record a spec file written by the computer in the postdata index.
+		The computer sends the modification time of the post directory from just before it wrote the data. 
+		If that matches the index then the only change is the new spec file and we can advance the index. 
+		Otherwise another writer changed the directory and we leave the index stale so the next lookup 
+		lists the directory again.
+		"""
+
+		index = self.lookups.get('postdata',None)
+		if index==None: index = self.postdata_index()
+		record = {'spec':name,'hash':spechash(attrs),'attrs':attrs}
+		self.postdata_add(index,record)
+		advance = mtime!=None and mtime==index['mtime']
+		with open(os.path.join(self.postdir,self.postdata_index_fn),'a') as fp:
+			fp.write(json.dumps(record)+'\n')
+		if advance:
+			index['mtime'] = self.postdata_mtime()
+			with open(os.path.join(self.postdir,self.postdata_index_fn),'a') as fp:
+				fp.write(json.dumps({'mtime':index['mtime']})+'\n')
+
+	def post_key(self,fn_base,specs):
+
+		"""
+		Name computed data by a hash of the specs and the base name, which contains the slice key and the 
+		calculation name, when paths.yaml sets "post_naming: hashed". 
+		"""
+
+		return '.h%s'%spechash([fn_base,specs])
+
 	def select_postdata(self,fn_base,calc,debug=False):
 	
 		"""
 		Search postprocess spec files for a match with a calculation.
 		Queries the spec files in order to determine if a calculation has been run already.
 		Also used by store.plot_header to identify the correct data to unpack.
+		We look up the spec files in the postdata index instead of reading them from the post directory.
 		"""
 
-		for specfn in glob.glob(self.postdir+fn_base+'*.spec'):
-			with open(specfn,'r') as fp: attrs = json.loads(fp.read())
-			if attrs=={} or attrs==calc['specs']: return specfn
+		if self.post_naming=='hashed':
+			#---the computer sends blank specs for calculations without them
+			specfn = self.postdir+fn_base+self.post_key(fn_base,calc.get('specs',''))+'.spec'
+			if os.path.isfile(specfn): return specfn
+		candidates = self.postdata_index()['bases'].get(fn_base,{})
+		#---calculations without specs (e.g. from plotload) only match empty spec files
+		calc_specs = calc.get('specs',None)
+		#---exact matches (and empty specs) are found by hash 
+		for key in [spechash({}),spechash(calc_specs)]:
+			if candidates.get(key,[]): return self.postdir+sorted(candidates[key])[0]
+		if calc_specs==None: candidates = {}
+		specs = self.lookups['postdata']['specs']
+		for specfn in sorted([i for j in candidates.values() for i in j]):
+			attrs = specs[specfn]['attrs']
+			specfn = self.postdir+specfn
+			if attrs=={} or attrs==calc_specs: return specfn
 			#---if specs are not identical we compare the ones that are and pass if they are equal
 			chop = deepcopy(attrs)
-			extra_keys = [key for key in chop if key not in calc['specs']]
+			extra_keys = [key for key in chop if key not in calc_specs]
 			for key in extra_keys: del chop[key]
-			if calc['specs']==chop: return specfn
+			if calc_specs==chop: return specfn
 		if debug: 
 			print '[ERROR] failed to find postdata ...'
 			import pdb;pdb.set_trace() #---legit
@@ -822,26 +1484,16 @@ class Workspace():
 
 	###---WORKPLACE ACTUATOR
 
-	def action(self,calculation_name=None):
-	
+	def prepare_specs(self):
+
 		"""
-		Parse a specifications file to make changes to a workspace.
-		This function interprets the specifications and acts on it. 
-		It manages the irreducible units of an omnicalc operation and ensures
-		that the correct data are sent to analysis functions in the right order.
+		Load the specifications and apply the variables and the internal references in them.
+		Both action and plan read the specs this way so that the plan matches what action will do.
 		"""
 
-		status('parsing specs file',tag='status')
-
-		#---load the yaml specifications file
 		specs = self.load_specs()
-		#### status('done loading specs',tag='status')		
-		
-		#---read simulations from the slices dictionary
-		sns = specs['slices'].keys()
 		#---variables are passed directly to self.vars
 		self.vars = deepcopy(specs['variables']) if 'variables' in specs else {}
-
 		#---apply "+"-delimited internal references in the yaml file
 		for path,sub in [(i,j[-1]) for i,j in catalog(specs) if type(j)==list 
 			and type(j)==str and re.match('^\+',j[-1])]:
@@ -852,30 +1504,173 @@ class Workspace():
 			source = delve(self.vars,*sub.strip('+').split('/'))
 			point = delve(specs,*path[:-1])
 			point[path[-1]] = source
+		return specs
+
+	def calculation_order(self,specs,calculation_name=None):
+
+		"""
+		Order the calculations in the specs so that each one follows its upstream dependencies.
+		"""
+
+		calcs = dict(specs['calculations'])
+		#---infer the correct order for the calculation keys from their upstream dependencies
+		upstream_catalog = [i for i,j in catalog(calcs) if 'upstream' in i]
+		#---if there are no specs required to get the upstream data object the user can either 
+		#---...use none/None as a placeholder or use the name as the key as in "upstream: name"
+		for uu,uc in enumerate(upstream_catalog):
+			if uc[-1]=='upstream': upstream_catalog[uu] = upstream_catalog[uu]+[delve(calcs,*uc)]
+		depends = {t[0]:[t[ii+1] for ii,i in enumerate(t) if ii<len(t)-1 and t[ii]=='upstream'] 
+			for t in upstream_catalog}
+		calckeys = [i for i in calcs if i not in depends]
+		#---check that the calckeys has enough elements 
+		list(set(calckeys+[i for j in depends.values() for i in j]))			
+		#---! come back to this!
+		while any(depends):
+			ii,i = depends.popitem()
+			if all([j in calckeys for j in i]) and i!=[]: calckeys.append(ii)
+			else: depends[ii] = i
+		#---if a specific calculation name is given then only perform that calculation
+		if not calculation_name is None: calckeys = [calculation_name]
+		return calckeys
+
+	def estimate_slice_input(self,sn,start,end):
+
+		"""
+		Estimate the bytes of trajectory we read to make a slice from the EDR times in the toc.
+		Each part contributes the fraction of its size which overlaps the slice window.
+		"""
+
+		sequence = self.get_timeseries(sn)
+		if not sequence: return 0
+		keylist,spans = zip(*sequence)
+		fns = self.keys_to_filenames(keylist,spot=(self.c,self.trajectory_format),strict=False)
+		total = 0.
+		for fn,(t0,t1) in zip(fns,spans):
+			if not os.path.isfile(fn): continue
+			if None in (t0,t1): total += os.path.getsize(fn)
+			elif t1>=start and t0<=end:
+				overlap = min(end,t1)-max(start,t0)
+				total += os.path.getsize(fn)*(overlap/float(t1-t0) if t1>t0 else 1.)
+		return int(total)
+
+	def plan(self,calculation_name=None):
+
+		"""
+		List the groups, slices, and calculations which action would make, along with estimated costs.
+		The cost of a slice is the size of the trajectory we read to make it and the cost of a calculation is 
+		the size of its slice. The slices and each stage of calculations are ordered by cost so the most 
+		expensive jobs can be started first. The workspace is not saved.
+		"""
+
+		specs = self.prepare_specs()
+		groups,slices,calcs,sizes,records = [],[],[],{},{}
+		for sn,root in specs['slices'].items():
+			self.slice(sn,part_name=self.trajectory_format)
+			for group in root.get('groups',{}):
+				fn = '%s.%s.ndx'%(self.prefixer(sn),group)
+				if not (os.path.isfile(self.postdir+fn) and group in self.groups[sn]): 
+					groups.append({'sn':sn,'group':group,'fn':fn})
+			#---slice records include the planned slices so we can name the calculations which use them
+			records[sn] = dict([(key,dict(val)) for key,val in self.slice(sn).items()])
+			for sl,details in root.get('slices',{}).items():
+				start,end,skip,pbc = [details.get(i,None) for i in ['start','end','skip','pbc']]
+				for group in details['groups']:
+					outkey = self.slice_outkey(sn,start,end,skip,group,pbc)
+					records[sn].setdefault(sl,{}).setdefault(group,{'start':start,'end':end,'skip':skip,
+						'group':group,'pbc':pbc,'filekey':outkey,'gro':outkey+'.gro',
+						self.trajectory_format:outkey+'.'+self.trajectory_format})
+					trajfile = self.postdir+outkey+'.'+self.trajectory_format
+					if os.path.isfile(trajfile) and os.path.isfile(self.postdir+outkey+'.gro'): 
+						sizes[outkey] = os.path.getsize(trajfile)
+						continue
+					#---action skips slices which failed before with the same inputs
+					if self.slice_failed(sn,sl,group,outkey): continue
+					superset = (self.find_superset_slice(sn,start,end,skip,group,pbc) 
+						if group in self.groups[sn] else None)
+					if superset: cost = os.path.getsize(self.postdir+superset[self.trajectory_format])
+					else: cost = self.estimate_slice_input(sn,start,end)
+					sizes[outkey] = cost
+					slices.append({'sn':sn,'slice_name':sl,'group':group,'outkey':outkey,'bytes':cost,
+						'source':superset['filekey'] if superset else 'parts'})
+		#---calculations run in stages according to their upstream dependencies
+		if 'calculations' in specs:
+			for stage,calcname in enumerate(self.calculation_order(specs,calculation_name=calculation_name)):
+				for calc in self.interpret_specs(specs['calculations'][calcname]):
+					if 'collections' in calc:
+						cols = [calc['collections']] if type(calc['collections'])==str else calc['collections']
+						sns = unique(flatten([specs['collections'][i] for i in cols]))
+					else: sns = self.sns()
+					group = calc.get('group',None)
+					slice_names = calc['slice_name'] if type(calc['slice_name'])==list else [calc['slice_name']]
+					for sn in sns:
+						job = {'sn':sn,'calculation':calcname,'stage':stage,'specs':calc.get('specs','')}
+						sn_records = records[sn] if sn in records else self.slice(sn)
+						try: 
+							fn_base = computer_fn_base(self,sn,calc['slice_name'],group,calcname,
+								records=sn_records)
+							job['bytes'] = sum([sizes.get(sn_records[s][group if group else 'all']['filekey'],0) 
+								for s in slice_names])
+						except KeyError: 
+							job.update(fn_base=None,bytes=0)
+							calcs.append(job)
+							continue
+						job['fn_base'] = fn_base
+						if self.select_postdata(fn_base,{'specs':job['specs']})==None: calcs.append(job)
+		slices = sorted(slices,key=lambda x:-x['bytes'])
+		calcs = sorted(calcs,key=lambda x:(x['stage'],-x['bytes']))
+		#---report the plan
+		bytesize = lambda x: '%.1fGB'%(x/1024.**3) if x>=1024**3 else '%.1fMB'%(x/1024.**2)
+		status('%d groups, %d slices reading %s, %d calculations reading %s'%(len(groups),len(slices),
+			bytesize(sum([i['bytes'] for i in slices])),len(calcs),
+			bytesize(sum([i['bytes'] for i in calcs]))),tag='plan')
+		for job in groups: status('group %s'%job['fn'],tag='plan')
+		for job in slices: status('slice %s %s from %s'%(
+			bytesize(job['bytes']).rjust(9),job['outkey'],job['source']),tag='plan')
+		for job in calcs:
+			if not job['fn_base']:
+				status('calculation %s for %s is missing a slice'%(job['calculation'],job['sn']),tag='warning')
+			else: status('calculation %s %s %s'%(bytesize(job['bytes']).rjust(9),job['fn_base'],
+				json.dumps(job['specs'],sort_keys=True)),tag='plan')
+		return {'groups':groups,'slices':slices,'calculations':calcs}
+
+	def action(self,calculation_name=None,retry=False):
+	
+		"""
+		Parse a specifications file to make changes to a workspace.
+		This function interprets the specifications and acts on it. 
+		It manages the irreducible units of an omnicalc operation and ensures
+		that the correct data are sent to analysis functions in the right order.
+		The retry flag makes slices which failed before even if their inputs have not changed.
+		"""
+
+		status('parsing specs file',tag='status')
+
+		#---load the yaml specifications file
+		specs = self.prepare_specs()
+		#---read simulations from the slices dictionary
+		sns = specs['slices'].keys()
 		
 		#---loop over all simulations to create groups and slices
 		self.save(quiet=True)
-		for route in [('slices',i) for i in sns]:
-			root,sn = delve(specs,*route),route[-1]
-			#---create groups
-			if 'groups' in root:
-				for group,select in root['groups'].items():
-					kwargs = {'group':group,'select':select,'sn':sn}
-					self.create_group(**kwargs)
-				root.pop('groups')
-			#---slice the trajectory
-			if 'slices' in root:
-				for sl,details in root['slices'].items(): 
-					#---! use a default group here?
-					for group in details['groups']:
-						kwargs = {'sn':sn,'start':details['start'],
-							'end':details['end'],'skip':details['skip'],'slice_name':sl}
-						kwargs['group'] = group
-						if 'pbc' in details: kwargs['pbc'] = details['pbc']
-						self.create_slice(**kwargs)
-				root.pop('slices')
-			if root != {}: raise Exception('[ERROR] unprocessed specifications %s'%str(root))
-			else: del root
+		errors = []
+		#---simulations are sliced in parallel by forked copies of the workspace which return their changes
+		#---...however confirming preexisting files requires input so we only fork with autoreload
+		nprocs = max(1,min(len(sns),self.machine.get('slice_procs',self.nprocs)))
+		if nprocs>1 and self.autoreload:
+			global slice_workspace
+			slice_workspace = self
+			pool = multiprocessing.Pool(nprocs)
+			try:
+				results = pool.imap(slice_worker,[(sn,specs['slices'][sn],retry) for sn in sns],chunksize=1)
+				for sn,changes in itertools.izip(sns,results): errors.extend(self.slice_merge(sn,changes))
+			finally:
+				pool.close()
+				pool.join()
+				slice_workspace = None
+		else:
+			for sn in sns: errors.extend(self.slice_simulation(sn,specs['slices'][sn],retry=retry))
+		for sn,sl,group,error in errors: status('%s,%s,%s: %s'%(sn,sl,group,error),tag='error')
+		if errors: status('failed to make %d groups or slices (see above)'%len(errors),tag='warning')
 		#---we only save after writing all slices. if the slicer fails autoreload will find preexisting files
 		self.save(quiet=True)
 		checktime()
@@ -893,35 +1688,16 @@ class Workspace():
 			status('starting calculations',tag='status')
 			#---note that most variables including calc mirror the specs file
 			self.calc = dict(specs['calculations'])
-			#---infer the correct order for the calculation keys from their upstream dependencies
-			upstream_catalog = [i for i,j in catalog(self.calc) if 'upstream' in i]
-			#---if there are no specs required to get the upstream data object the user can either 
-			#---...use none/None as a placeholder or use the name as the key as in "upstream: name"
-			for uu,uc in enumerate(upstream_catalog):
-				if uc[-1]=='upstream': upstream_catalog[uu] = upstream_catalog[uu]+[delve(self.calc,*uc)]
-			depends = {t[0]:[t[ii+1] for ii,i in enumerate(t) if ii<len(t)-1 and t[ii]=='upstream'] 
-				for t in upstream_catalog}
-			calckeys = [i for i in self.calc if i not in depends]
-			#---check that the calckeys has enough elements 
-			list(set(calckeys+[i for j in depends.values() for i in j]))			
-			#---! come back to this!
-			while any(depends):
-				ii,i = depends.popitem()
-				if all([j in calckeys for j in i]) and i!=[]: calckeys.append(ii)
-				else: depends[ii] = i
-			#---if a specific calculation name is given then only perform that calculation
-			if not calculation_name is None: calckeys = [calculation_name]
+			calckeys = self.calculation_order(specs,calculation_name=calculation_name)
 			for calcname in calckeys:
 				details = specs['calculations'][calcname]
 				status('checking calculation %s'%calcname,tag='status')
 				new_calcs = self.interpret_specs(details)
+				#---find the script with the funtion once for all of the calculations
+				fns = script_registry('./',prune=[self.postdir,self.plotdir])
+				search = filter(lambda x:re.match('^\.\/[^ate].+\/%s\.py$'%calcname,x),fns)
 				#---perform calculations
 				for calc in new_calcs:
-					#---find the script with the funtion
-					fns = []
-					for (dirpath, dirnames, filenames) in os.walk('./'): 
-						fns.extend([dirpath+'/'+fn for fn in filenames])
-					search = filter(lambda x:re.match('^\.\/[^ate].+\/%s\.py$'%calcname,x),fns)
 					if len(search)==0: raise Exception('\n[ERROR] cannot find %s.py'%calcname)
 					elif len(search)>1: raise Exception('\n[ERROR] redundant matches: %s'%str(search))
 					else:
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+
+"""
+Read timestamps and frame offsets directly from the XDR-encoded headers of GROMACS binary files.
+These readers avoid decoding the data in each frame and return None when they cannot parse a file so the
+callers can fall back to the GROMACS utilities.
+"""
+
+import os,struct
+import numpy as np
+
+#---CONSTANTS
+#-------------------------------------------------------------------------------------------------------------
+
+#---energy frames start with a real (single or double precision) set to -2e10 and then a magic number
+edr_frame_magic = -7777777
+edr_markers = [struct.pack('>fi',-2e10,edr_frame_magic),struct.pack('>di',-2e10,edr_frame_magic)]
+#---the frame header continues with the file version (int) and the time (double)
+edr_header = struct.Struct('>id')
+#---newest energy file version we know how to read
+edr_version_max = 5
+#---bytes per item for the subblock data types (int, float, double, int64) in energy frames
+edr_subblock_sizes = {0:4,1:4,2:8,3:8}
+#---compressed trajectory frames start with magic, natoms, step, time, box, natoms
+xtc_magic = 1995
+xtc_header = struct.Struct('>iiif9fi')
+#---compressed coordinates follow the header with precision, minint, maxint, smallidx, and a byte count
+xtc_coords_header = struct.Struct('>f3i3iii')
+
+#---EDR
+#-------------------------------------------------------------------------------------------------------------
+
+def edr_frame_time(fp,offset,marker):
+
+	"""
+	Read the time from the energy frame whose marker starts at offset.
+	"""
+
+	fp.seek(offset+len(marker))
+	raw = fp.read(edr_header.size)
+	if len(raw)<edr_header.size: return None
+	version,time = edr_header.unpack(raw)
+	if version<2 or version>edr_version_max or time!=time: return None
+	return time
+
+def edr_frame_length(fp,offset,marker):
+
+	"""
+	Read the header of the energy frame whose marker starts at offset and return the length of the frame.
+	Frames with averages (nsum>1) store three reals for each energy term and frames without them store one,
+	so the last frame of a run can be shorter than the others. Returns None for frames that we cannot read,
+	including subblocks of characters or strings.
+	"""
+
+	real = len(marker)-4
+	fp.seek(offset+len(marker))
+	def read(fmt):
+		raw = fp.read(struct.calcsize(fmt))
+		if len(raw)<struct.calcsize(fmt): raise ValueError
+		return struct.unpack(fmt,raw)
+	try:
+		version,time = read('>id')
+		if version<2 or version>edr_version_max: return None
+		step,nsum = read('>qi')
+		if version>=3: read('>q')
+		if version>=5: read('>d')
+		nre,ndisre,nblock = read('>3i')
+		if nre<0 or nblock<0 or (version<4 and ndisre!=0): return None
+		data = nre*real*(3 if nsum>0 else 1)
+		for block in range(nblock):
+			#---old versions have one subblock of reals for each block
+			if version<4: subblocks = [(read('>i')[0],None)]
+			else: 
+				nsub = read('>2i')[1]
+				if nsub<0: return None
+				subblocks = [read('>2i') for sub in range(nsub)]
+			for nr,kind in subblocks:
+				width = real if kind==None else edr_subblock_sizes.get(kind,None)
+				if nr<0 or width==None: return None
+				data += nr*width
+		#---the header ends with the energy size and two reserved integers
+		read('>3i')
+	except ValueError: return None
+	return fp.tell()-offset+data
+
+def edr_find_markers(raw,marker):
+
+	"""
+	Return the offsets of every frame marker in a block of bytes.
+	"""
+
+	offsets,found = [],raw.find(marker)
+	while found!=-1:
+		offsets.append(found)
+		found = raw.find(marker,found+1)
+	return offsets
+
+def edr_times(fn,chunk=2**16):
+
+	"""
+	Get the start and end times of an energy file from the first and last frame headers.
+	We find the first frame after the energy names and then search blocks from the end of the file for the
+	last frame. The length of the last frame comes from its own header so we can discard a truncated frame.
+	Energy files with the old (version 1) headers or a last frame we cannot confirm return None.
+	"""
+
+	size = os.path.getsize(fn)
+	with open(fn,'rb') as fp:
+		#---the energy names precede the first frame and identify the precision
+		head = fp.read(min(size,16*chunk))
+		candidates = [(head.find(marker),marker) for marker in edr_markers]
+		candidates = [(offset,marker) for offset,marker in candidates if offset!=-1]
+		if not candidates: return None
+		first,marker = min(candidates)
+		start = edr_frame_time(fp,first,marker)
+		if start==None: return None
+		#---read increasingly large blocks from the end of the file until we find the last two frames
+		window = chunk
+		while True:
+			begin = max(first,size-window)
+			fp.seek(begin)
+			offsets = [begin+i for i in edr_find_markers(fp.read(size-begin),marker)]
+			if len(offsets)>=2 or begin==first: break
+			window *= 4
+		if not offsets: return None
+		#---the last frame is incomplete if it runs past the end of the file
+		length = edr_frame_length(fp,offsets[-1],marker)
+		if length==None: return None
+		if offsets[-1]+length>size:
+			truncated = offsets.pop()
+			#---the previous frame must end where the truncated frame starts
+			if not offsets or edr_frame_length(fp,offsets[-1],marker)!=truncated-offsets[-1]: return None
+		elif offsets[-1]+length!=size: return None
+		end = edr_frame_time(fp,offsets[-1],marker)
+		if end==None: return None
+	return start,end
+
+#---XTC
+#-------------------------------------------------------------------------------------------------------------
+
+def xtc_index(fn):
+
+	"""
+	Index the frames of an XTC file by reading only the frame headers.
+	Each header gives the size of the compressed coordinates so we can seek directly to the next frame.
+	Returns a dictionary of byte offsets and times for each frame (and a truncated last frame is ignored) 
+	or None if the file is not a valid XTC file.
+	"""
+
+	size = os.path.getsize(fn)
+	offsets,times = [],[]
+	with open(fn,'rb') as fp:
+		offset = 0
+		while offset+xtc_header.size<=size:
+			fp.seek(offset)
+			header = xtc_header.unpack(fp.read(xtc_header.size))
+			magic,natoms,step,time = header[:4]
+			if magic!=xtc_magic or natoms!=header[-1]: return None
+			#---small systems are written without compression
+			if natoms<=9: length = xtc_header.size+3*natoms*4
+			else:
+				raw = fp.read(xtc_coords_header.size)
+				if len(raw)<xtc_coords_header.size: break
+				nbytes = xtc_coords_header.unpack(raw)[-1]
+				length = xtc_header.size+xtc_coords_header.size+(nbytes+3)/4*4
+			if offset+length>size: break
+			offsets.append(offset)
+			times.append(time)
+			offset += length
+	return {'offsets':np.array(offsets,dtype=np.int64),'times':np.array(times,dtype=np.float64)}
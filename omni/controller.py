@@ -4,7 +4,7 @@ import os,sys,time,shutil
 import yaml
 import re,pickle,subprocess,glob,inspect
 from base.store import load
-from base.tools import unpacker,delve,status,call
+from base.tools import unpacker,delve,status,call,path_expand,script_registry
 
 conf_paths,conf_gromacs = "paths.yaml","gromacs.py"
 if not os.path.isfile(conf_gromacs): shutil.copyfile('omni/base/default_config.py','./'+conf_gromacs)
@@ -12,19 +12,31 @@ if not os.path.isfile(conf_gromacs): shutil.copyfile('omni/base/default_config.p
 #---FUNCTIONS
 #-------------------------------------------------------------------------------------------------------------
 
-def compute(calculation_name=None,autoreload=True):
+def compute(calculation_name=None,autoreload=True,retry=False):
 
 	"""
 	Open the workspace, parse a YAML script with instructions, save, and exit.
 	Note that we may specify a particular calculation if there are many pending calculations.
+	Slices which failed are skipped until their inputs change unless you use "make compute retry".
 	"""
 
 	from base.workspace import Workspace
 	workspace = unpacker(conf_paths)['workspace_spot']
 	work = Workspace(workspace,autoreload=autoreload)
-	work.action(calculation_name=calculation_name)
+	work.action(calculation_name=calculation_name,retry=retry)
 	work.save()
 
+def plan(calculation_name=None):
+
+	"""
+	List the groups, slices, and calculations that "make compute" would run with estimated costs.
+	"""
+
+	from base.workspace import Workspace
+	workspace = unpacker(conf_paths)['workspace_spot']
+	work = Workspace(workspace,autoreload=True)
+	work.plan(calculation_name=calculation_name)
+
 def look(workspace=None,nox=False):
 
 	"""
@@ -69,15 +81,15 @@ def plot(plotname=None,nox=False,workspace=None,specfile=None,plotlog=False,**kw
 	if plotname == None:
 		from base.workspace import Workspace
 		if workspace == None: workspace = unpacker(conf_paths)['workspace_spot']
-		work = Workspace(workspace,previous=False)
+		work = Workspace(workspace,previous=False,lazy=True)
 		specs = work.load_specs()
 		plotnames = specs['plots'].keys()
 	else: plotnames = [plotname]
+	#---list the scripts once without descending into the post and plot directories
+	paths = unpacker(conf_paths)
+	fns = script_registry('./',prune=[path_expand(paths[i]) for i in ['post_data_spot','post_plot_spot']])
 	#---for each desired plot type
 	for pname in plotnames:
-		fns = []
-		for (dirpath, dirnames, filenames) in os.walk('./'): 
-			fns.extend([dirpath+'/'+fn for fn in filenames])
 		search = filter(lambda x:re.match('^\.\/[^omni].+\/plot-%s\.py$'%pname,x),fns)
 		if len(search)!=1: status('unclear search for %s: %s'%(pname,str(search)))
 		else: 
@@ -103,6 +115,21 @@ def tests(nox=False):
 		print '[TEST SUITE] plotting %s'%name
 		os.system('python calcs/plot-'+name+'.py'+(' nox' if nox else ''))
 
+def benchmark(name,size=None,legacy=False):
+
+	"""
+	Run a synthetic benchmark from omni/base/benchmark.py e.g. "make benchmark treeparser size=100000".
+	"""
+
+	import base.benchmark
+	function = getattr(base.benchmark,'benchmark_%s'%name,None)
+	if not function: 
+		raise Exception('[ERROR] available benchmarks: %s'%', '.join([re.sub('^benchmark_','',i) 
+			for i in dir(base.benchmark) if re.match('^benchmark_',i)]))
+	kwargs = {'legacy':legacy}
+	if size: kwargs['size'] = int(size)
+	function(**kwargs)
+
 def export_to_factory(project_name,project_location,workspace=None):
 
 	"""